@@ -6,7 +6,9 @@ from flask_migrate import Migrate
 from flask_oauthlib.client import OAuth
 from flask_sqlalchemy import SQLAlchemy
 
-MOCK_OUT_RC_API = False
+from backend.metrics import InstrumentedRemoteApp
+
+MOCK_OUT_RC_API = os.environ.get('MOCK_OUT_RC_API', 'FALSE') == 'TRUE'
 
 # Flask won't route URLs in the static_url_path, so we set it to something
 # arbitrary and unlikely to be ever used (hence the included random GUID).
@@ -21,29 +23,72 @@ app.config.update(dict(
     STATIC_BASE=os.path.realpath(os.path.abspath(os.path.join(app.root_path, '../build/'))),
     STATIC_FILE_ON_404='index.html',
     DEV=os.environ['DEV'],
-    DEBUG_SHOW_ALL=os.environ.get('DEBUG_SHOW_ALL', False)
+    DEBUG_SHOW_ALL=os.environ.get('DEBUG_SHOW_ALL', False),
+    CACHE_LOCAL_SIZE=int(os.environ.get('CACHE_LOCAL_SIZE', 1024)),
+    CACHE_LOCAL_TTL=int(os.environ.get('CACHE_LOCAL_TTL', 300)),
+    RC_MAX_WORKERS=int(os.environ.get('RC_MAX_WORKERS', 8)),
+    RC_DEADLINE=float(os.environ.get('RC_DEADLINE', 20)),
+    RC_HTTP_POOL_SIZE=int(os.environ.get('RC_HTTP_POOL_SIZE', 10)),
+    RC_HTTP_RETRIES=int(os.environ.get('RC_HTTP_RETRIES', 2)),
+    RC_HTTP_BACKOFF=float(os.environ.get('RC_HTTP_BACKOFF', 0.2)),
+    RC_CONNECT_TIMEOUT=float(os.environ.get('RC_CONNECT_TIMEOUT', 3.05)),
+    RC_READ_TIMEOUT=float(os.environ.get('RC_READ_TIMEOUT', 10)),
+    RC_API_TOKEN=os.environ.get('RC_API_TOKEN', None),
+    ROSTER_MAX_AGE=int(os.environ.get('ROSTER_MAX_AGE', 600)),
+    ROSTER_REFRESH_INTERVAL=int(os.environ.get('ROSTER_REFRESH_INTERVAL', 0)),
+    CACHE_SWEEP_INTERVAL=int(os.environ.get('CACHE_SWEEP_INTERVAL', 0)),
+    CACHE_SWEEP_CHUNK=int(os.environ.get('CACHE_SWEEP_CHUNK', 1000)),
+    CACHE_WARM_LEAD=int(os.environ.get('CACHE_WARM_LEAD', 0)),
+    CACHE_WARM_CHECK_INTERVAL=int(os.environ.get('CACHE_WARM_CHECK_INTERVAL', 15 * 60)),
+    MOCK_RC_BATCHES=int(os.environ.get('MOCK_RC_BATCHES', 10)),
+    MOCK_RC_PEOPLE=int(os.environ.get('MOCK_RC_PEOPLE', 60)),
+    MOCK_RC_FACULTY=int(os.environ.get('MOCK_RC_FACULTY', 10)),
+    MOCK_RC_SEED=int(os.environ.get('MOCK_RC_SEED', 0)),
+    MOCK_RC_LATENCY_MS=float(os.environ.get('MOCK_RC_LATENCY_MS', 0)),
+    MOCK_RC_JITTER_MS=float(os.environ.get('MOCK_RC_JITTER_MS', 0)),
+    MOCK_RC_ERROR_RATE=float(os.environ.get('MOCK_RC_ERROR_RATE', 0)),
+    SAVE_COALESCE_SECONDS=float(os.environ.get('SAVE_COALESCE_SECONDS', 0)),
+    DELTA_SETTLE_SECONDS=int(os.environ.get('DELTA_SETTLE_SECONDS', 5)),
+    NICETY_TEXT_ENCODING=os.environ.get('NICETY_TEXT_ENCODING', 'base64'),
+    PAGE_SIZE_MAX=int(os.environ.get('PAGE_SIZE_MAX', 200)),
+    USER_SESSION_SNAPSHOT=os.environ.get('USER_SESSION_SNAPSHOT', 'FALSE') == 'TRUE',
+    METRICS_TOKEN=os.environ.get('METRICS_TOKEN', None),
+    SQL_SLOW_MS=float(os.environ.get('SQL_SLOW_MS', 250)),
+    SQL_ENFORCE_BUDGETS=os.environ.get('SQL_ENFORCE_BUDGETS', 'FALSE') == 'TRUE',
 ))
 app.static_folder = app.config.get('STATIC_BASE', './static/')
 
 with app.app_context():
     db = SQLAlchemy(app)
-    rc = OAuth(app).remote_app(
-        'recurse_center',
-        base_url='https://www.recurse.com/api/v1/',
-        access_token_url='https://www.recurse.com/oauth/token',
-        request_token_url=None,
-        authorize_url='https://www.recurse.com/oauth/authorize',
-        consumer_key=os.environ['RC_OAUTH_ID'],  # Deliberately throw exception if not set
-        consumer_secret=os.environ['RC_OAUTH_SECRET'],  # Deliberately throw exception it not set
-        access_token_method='POST',
-
-    )
+    if MOCK_OUT_RC_API:
+        from backend.mock.rc import MockRCOAuthAPI
+        rc = MockRCOAuthAPI.from_config(app.config)
+    else:
+        from backend.rcclient import PooledRemoteApp
+        oauth = OAuth(app)
+        rc = PooledRemoteApp(
+            oauth,
+            'recurse_center',
+            base_url='https://www.recurse.com/api/v1/',
+            access_token_url='https://www.recurse.com/oauth/token',
+            request_token_url=None,
+            authorize_url='https://www.recurse.com/oauth/authorize',
+            consumer_key=os.environ['RC_OAUTH_ID'],  # Deliberately throw exception if not set
+            consumer_secret=os.environ['RC_OAUTH_SECRET'],  # Deliberately throw exception it not set
+            access_token_method='POST',
+
+        )
+        oauth.remote_apps['recurse_center'] = rc
+    # Record the latency and status of every RC API request
+    rc = InstrumentedRemoteApp(rc)
     migrate = Migrate(app, db)
 
 # Imports for URLs that should be available
+import backend.querystats  # noqa
 import backend.api  # noqa
 import backend.auth  # noqa
 import backend.static  # noqa
+import backend.commands  # noqa
 
 # This file exports:
 #   app     The Flask() object
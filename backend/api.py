@@ -1,14 +1,203 @@
+import hmac
 import random
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from functools import partial, wraps
+from hashlib import sha1
 
 import backend.cache as cache
 import backend.config as config
+import backend.metrics as metrics
+import backend.scheduler as scheduler
 import backend.util as util
+import requests
 from backend import app, db, rc
 from backend.auth import current_user, needs_authorization
 from backend.models import Nicety, SiteConfiguration
-from flask import abort, json, jsonify, redirect, request, url_for
+from backend.querystats import query_budget
+from backend.writebehind import WriteBehindBuffer
+from flask import abort, json, jsonify, make_response, redirect, request, url_for
 from flask.views import MethodView
+from sqlalchemy import and_, bindparam, func, literal_column, or_, tuple_
+from sqlalchemy.dialects import postgresql
+from werkzeug.exceptions import HTTPException
+
+# Cache key for the materialized staying/leaving/faculty roster
+ROSTER_KEY = 'people-roster'
+
+# Postgres text search configuration used to index and search nicety text
+SEARCH_CONFIG = 'english'
+
+# Admins see the niceties for batches ending this many days either side of today
+ADMIN_WINDOW_DAYS = 21
+
+# Response header carrying the cursor of the next page of a paginated view
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class RCAPIError(HTTPException):
+    code = 502
+
+    def __init__(self, **kwargs):
+        super(RCAPIError, self).__init__(description=kwargs.get('description', ''))
+
+
+def rc_get(url):
+    """Fetch `url` from the RC API, raising `RCAPIError` rather than returning
+    the error body if the request failed, so that errors are never cached."""
+    try:
+        resp = rc.get(url)
+    except requests.RequestException as e:
+        raise RCAPIError(description='RC API request for {} failed: {}'.format(url, e))
+    status = getattr(resp, 'status', 200)
+    if status != 200:
+        raise RCAPIError(description='RC API returned {} for {}'.format(status, url))
+    return resp.data
+
+
+def conditional(validator):
+    """Decorates a view so that its response carries a strong ETag computed
+    from the request URL and `validator(*args, **kwargs)`, and so that requests
+    whose If-None-Match already holds that ETag get a 304 without the view being
+    called. `validator` must change whenever the view's output would, and should
+    be far cheaper to compute than the view itself."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            version = repr((request.full_path, validator(*args, **kwargs)))
+            etag = sha1(version.encode('utf-8')).hexdigest()
+            if etag in request.if_none_match:
+                response = app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+
+def nicety_versions(query):
+    """Returns a summary of the rows matched by the `Nicety` `query` which changes
+    whenever a row is added or saved with a new `date_updated`."""
+    return query.with_entities(
+        func.count(Nicety.id),
+        func.md5(func.string_agg(
+            func.concat(Nicety.id, ':', Nicety.date_updated),
+            postgresql.aggregate_order_by(literal_column("','"), Nicety.id)))).one()
+
+
+def encode_cursor(nicety):
+    """Returns the opaque pagination cursor pointing just after `nicety`."""
+    end_date = nicety.end_date.isoformat() if nicety.end_date is not None else ''
+    position = '{}:{}'.format(end_date, nicety.id)
+    return urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        end_date, nicety_id = urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split(':')
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+        return end_date, int(nicety_id)
+    except ValueError:
+        abort(400, description='Invalid pagination cursor')
+
+
+def page_requested():
+    """Whether the client asked for a page of results rather than all of them."""
+    return 'limit' in request.args or 'after' in request.args
+
+
+def page_query(query, limit, end_date=None, nicety_id=None):
+    """Returns a query for at most `limit` of the niceties matched by the `Nicety`
+    `query` in (end_date, id) order, undated ones first, starting after the one
+    with `end_date` and `nicety_id` if given. Dated niceties are read in
+    (end_date, id) order, which the end date indexes can serve, and undated
+    ones in id order, each with its own condition, rather than sorting all of
+    them by one expression."""
+    query = query.order_by(None)
+    dated = query.filter(Nicety.end_date.isnot(None))
+    if end_date is not None:
+        dated = dated.filter(tuple_(Nicety.end_date, Nicety.id) > tuple_(end_date, nicety_id))
+    dated = dated.order_by(Nicety.end_date, Nicety.id).limit(limit)
+    if end_date is not None:
+        return dated
+    undated = query.filter(Nicety.end_date.is_(None))
+    if nicety_id is not None:
+        undated = undated.filter(Nicety.id > nicety_id)
+    undated = undated.order_by(Nicety.id).limit(limit)
+    return (undated
+            .union_all(dated)
+            .order_by(Nicety.end_date.nullsfirst(), Nicety.id)
+            .limit(limit))
+
+
+def paginate(query, always=False):
+    """Returns the niceties matched by the `Nicety` `query`, and the cursor of the
+    next page. Clients opt in to pagination with the `limit` (at most
+    `PAGE_SIZE_MAX`) and `after` (the cursor of the previous page) parameters,
+    which page through the niceties in (end_date, id) order, undated ones
+    first. Otherwise every nicety is returned, in the query's own order, and the
+    cursor is None, as it is on the last page. Views passing `always` are
+    always paginated, `PAGE_SIZE_MAX` niceties at a time by default."""
+    if not (always or page_requested()):
+        return query.all(), None
+    limit = request.args.get('limit', type=int)
+    after = request.args.get('after')
+    if limit is not None and limit < 1:
+        abort(400, description='limit must be positive')
+    limit = min(limit or app.config['PAGE_SIZE_MAX'], app.config['PAGE_SIZE_MAX'])
+    cursor = decode_cursor(after) if after is not None else ()
+    niceties = page_query(query, limit + 1, *cursor).all()
+    if len(niceties) > limit:
+        return niceties[:limit], encode_cursor(niceties[limit - 1])
+    return niceties, None
+
+
+def nicety_groups(query, group_by, order_groups_by, order_niceties_by, with_text_only=False):
+    """Groups the niceties matched by the `Nicety` `query` in the database,
+    returning a query for one row per distinct value of the column `group_by`,
+    in `order_groups_by` order: that value, and a list of the group's niceties
+    as dicts of column values in `order_niceties_by` order. Niceties without
+    text are left out of the lists if `with_text_only` is set, but their
+    groups still appear. `end_date` comes back as an ISO date string and `text`
+    as stored, still encoded."""
+    nicety = func.json_build_object(
+        'id', Nicety.id,
+        'author_id', Nicety.author_id,
+        'target_id', Nicety.target_id,
+        'end_date', Nicety.end_date,
+        'anonymous', Nicety.anonymous,
+        'no_read', Nicety.no_read,
+        'text', Nicety.text)
+    niceties = func.json_agg(postgresql.aggregate_order_by(nicety, *order_niceties_by))
+    if with_text_only:
+        niceties = niceties.filter(Nicety.text.isnot(None))
+    return (query
+            .order_by(None)
+            .with_entities(group_by, func.coalesce(niceties, literal_column("'[]'::json")))
+            .group_by(group_by)
+            .order_by(*order_groups_by))
+
+
+def page_headers(cursor):
+    """Response headers telling the client where the next page starts, if there
+    is one; the JSON bodies of paginated views are unchanged."""
+    return {} if cursor is None else {NEXT_CURSOR_HEADER: cursor}
+
+
+def cached_version(key, fill, max_age=None):
+    """Validator for views that serve the value cached under `key`: `fill` is
+    called to make sure the value is cached, and the time it was stored is
+    returned. `max_age` must be the one `fill` reads the value with."""
+    fill()
+    try:
+        return cache.last_updated(key, max_age)
+    except cache.NotInCache:
+        # The value expired just after `fill` read it
+        fill()
+        return cache.last_updated(key, max_age)
 
 
 def format_info(p):
@@ -58,45 +247,86 @@ def format_info(p):
 
 
 def cache_batches_call():
-    res = rc.get('batches').data
-    return res
+    return cache.get_or_set('batches', lambda: rc_get('batches'))
 
 
 def cache_people_call(batch_id):
-    people = []
-    batch = rc.get('profiles?batch_id={}'.format(batch_id)).data
-    for p in batch:
-        people.append(format_info(p))
-
-    return people
+    return cache.get_or_set(
+        'batch:{}'.format(batch_id),
+        lambda: [format_info(p) for p in rc_get('profiles?batch_id={}'.format(batch_id))])
 
 
 def cache_person_call(person_id):
-    p = rc.get('profiles/{}'.format(person_id)).data
-    return format_info(p)
+    return cache.get_or_set(
+        'person:{}'.format(person_id),
+        lambda: format_info(rc_get('profiles/{}'.format(person_id))))
 
 
 def get_current_faculty():
-    f = rc.get('profiles?role=faculty').data
-    return [
-        format_info(profile)
-        for profile in f
-        if util.profile_is_faculty(profile)
-    ]
+    return cache.get_or_set(
+        'faculty',
+        lambda: [
+            format_info(profile)
+            for profile in rc_get('profiles?role=faculty')
+            if util.profile_is_faculty(profile)
+        ])
 
 
-def get_current_batches_info():
+_batch_index = (None, None)  # (when the batch list was cached, util.BatchIndex)
+
+
+def get_batch_index():
+    """Returns a `util.BatchIndex` of the cached batch list, built again only
+    when the list itself has been refetched."""
+    global _batch_index
     batches = cache_batches_call()
-    ret = [batch for batch in batches if util.open_batches(batch['end_date'])]
-    return ret
+    try:
+        updated = cache.last_updated('batches')
+    except cache.NotInCache:
+        updated = None
+    cached_for, index = _batch_index
+    if index is None or updated is None or cached_for != updated:
+        index = util.BatchIndex(batches)
+        _batch_index = (updated, index)
+    return index
+
+
+def batches_ending_around(end_dates):
+    """Returns the ids of the batches ending on any of `end_dates` (a collection of
+    `datetime.date`), together with the batches ending next after each of those,
+    whose members overlapped with them and so wrote them niceties."""
+    return get_batch_index().ending_around(end_dates)
+
+
+def resolve_people(person_ids, end_dates=()):
+    """Returns a mapping from RC person id to formatted profile for every id in
+    `person_ids`. The rosters of the batches around `end_dates` are consulted
+    first, so most people are resolved with one (cached) call per batch; anyone
+    left over is looked up individually. The rosters, and then the individual
+    profiles, are fetched concurrently."""
+    wanted = set(person_ids)
+    people = {}
+    if wanted and end_dates:
+        rosters = util.call_concurrently(
+            *[partial(cache_people_call, batch_id) for batch_id in batches_ending_around(end_dates)])
+        for roster in rosters:
+            for person in roster:
+                if person['id'] in wanted:
+                    people[person['id']] = person
+    leftover = list(wanted.difference(people))
+    profiles = util.call_concurrently(*[partial(cache_person_call, person_id) for person_id in leftover])
+    people.update(zip(leftover, profiles))
+    return people
+
+
+def get_current_batches_info():
+    return get_batch_index().open_batches()
 
 
 def get_current_users():
     batches = get_current_batches_info()
-    if batches != []:
-        return [person for batch in batches for person in cache_people_call(batch['id'])]
-    else:
-        return []
+    rosters = util.call_concurrently(*[partial(cache_people_call, batch['id']) for batch in batches])
+    return [person for roster in rosters for person in roster]
 
 
 def partition_current_users(users):
@@ -104,17 +334,7 @@ def partition_current_users(users):
         'staying': [],
         'leaving': []
     }
-    user_stints = [user['stints'] for user in users]
-    end_dates = []
-    for stints in user_stints:
-        if stints != []:
-            for stint in stints:
-                if stint['end_date'] is not None and stint['type'] == 'retreat':
-                    end_dates.append(stint['end_date'])
-    end_dates = sorted(list(set(end_dates)))
-    end_dates = end_dates[::-1]
-    staying_date = datetime.strptime(end_dates[0], "%Y-%m-%d")
-    leaving_date = datetime.strptime(end_dates[1], "%Y-%m-%d")
+    staying_date, leaving_date = get_batch_index().staying_and_leaving()
     for u in users:
         # Batchlings have   is_recurser = True,      is_faculty = False
         # Faculty have      is_recurser = ?,         is_faculty = True
@@ -122,7 +342,9 @@ def partition_current_users(users):
         if ((u['is_recurser'] and not u['is_faculty']) or
             (not u['is_faculty'] and not u['is_recurser'] and config.get(config.INCLUDE_RESIDENTS, False)) or
                 (u['is_faculty'] and config.get(config.INCLUDE_FACULTY, False))):
-            if u['end_date'] == staying_date:
+            if u['end_date'] is None:
+                pass
+            elif u['end_date'] == staying_date:
                 ret['staying'].append(u)
             elif u['end_date'] == leaving_date:
                 ret['leaving'].append(u)
@@ -131,6 +353,104 @@ def partition_current_users(users):
     return ret
 
 
+def build_roster():
+    """Computes the staying/leaving/faculty partition of current people shown on
+    the people page, before any per-user exclusion or shuffling."""
+    # Fetch the faculty list alongside the rosters rather than after them
+    batches = get_current_batches_info()
+    faculty, *rosters = util.call_concurrently(
+        get_current_faculty,
+        *[partial(cache_people_call, batch['id']) for batch in batches])
+    people = partition_current_users([person for roster in rosters for person in roster])
+    return {
+        'staying': people['staying'],
+        'leaving': people['leaving'],
+        'faculty': faculty,
+    }
+
+
+def refresh_roster():
+    """Rebuilds the roster snapshot stored in the cache and returns it."""
+    roster = build_roster()
+    cache.set(ROSTER_KEY, roster)
+    return roster
+
+
+def get_roster():
+    """Returns the roster snapshot, rebuilding it first if it is missing or older
+    than `ROSTER_MAX_AGE` seconds (e.g. if no background refresher is running)."""
+    try:
+        return cache.get(ROSTER_KEY, app.config['ROSTER_MAX_AGE'])
+    except cache.NotInCache:
+        return refresh_roster()
+
+
+@app.before_first_request
+def start_roster_refresher():
+    if app.config['ROSTER_REFRESH_INTERVAL'] > 0:
+        scheduler.every(app.config['ROSTER_REFRESH_INTERVAL'], refresh_roster, 'roster-refresh')
+
+
+def warm_cache():
+    """Refetches from the RC API everything the busiest pages need: the batch
+    list, the roster of every open batch and the faculty list, fetched
+    concurrently, and then seeds the individual profile of everyone in them
+    from those rosters. Finally rebuilds the roster snapshot. Returns the number
+    of batches, rosters and profiles cached."""
+    batches = rc_get('batches')
+    cache.set('batches', batches)
+    open_batches = util.BatchIndex(batches).open_batches()
+
+    def fetch_faculty():
+        return [format_info(profile)
+                for profile in rc_get('profiles?role=faculty')
+                if util.profile_is_faculty(profile)]
+
+    def fetch_roster(batch_id):
+        return [format_info(p) for p in rc_get('profiles?batch_id={}'.format(batch_id))]
+
+    faculty, *rosters = util.call_concurrently(
+        fetch_faculty, *[partial(fetch_roster, batch['id']) for batch in open_batches])
+    items = {'faculty': faculty}
+    for batch, roster in zip(open_batches, rosters):
+        items['batch:{}'.format(batch['id'])] = roster
+    for person in faculty + [person for roster in rosters for person in roster]:
+        items['person:{}'.format(person['id'])] = person
+    cache.set_many(items)
+    refresh_roster()
+    return {
+        'batches': len(batches),
+        'rosters': len(rosters),
+        'profiles': len(items) - len(rosters) - 1,
+    }
+
+
+_last_warmed_for = None
+
+
+def warm_cache_if_due():
+    """Warms the cache once per writing window, when the batch index says it
+    closes within `CACHE_WARM_LEAD` seconds."""
+    global _last_warmed_for
+    now = datetime.now()
+    time_left = get_batch_index().next_window(now)
+    if time_left is None:
+        return
+    closing = (now + time_left).strftime('%Y-%m-%d')
+    if closing == _last_warmed_for:
+        return
+    if time_left <= timedelta(seconds=app.config['CACHE_WARM_LEAD']):
+        app.logger.info('Warming the cache ahead of the batch ending %s', closing)
+        warm_cache()
+        _last_warmed_for = closing
+
+
+@app.before_first_request
+def start_cache_warmer():
+    if app.config['CACHE_WARM_LEAD'] > 0:
+        scheduler.every(app.config['CACHE_WARM_CHECK_INTERVAL'], warm_cache_if_due, 'cache-warm')
+
+
 @app.route('/api/v1/people/<int:person_id>')
 @needs_authorization
 def get_person_info(person_id):
@@ -148,125 +468,332 @@ def get_self_info():
     return jsonify(data)
 
 
+@app.route('/api/v1/metrics')
+def get_metrics():
+    """RC API and cache metrics for this worker, in Prometheus' text format. Open
+    to admins, and to scrapers presenting `METRICS_TOKEN` as a bearer token."""
+    token = app.config.get('METRICS_TOKEN')
+    presented = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(presented, 'Bearer ' + token)):
+        user = current_user()
+        if user is None or not util.admin_access(user):
+            return abort(403)
+    stats = cache.local.stats()
+    text = metrics.render(
+        ('cache_local_entries', 'gauge', "Entries in this worker's in-memory cache.", stats['size']),
+        ('cache_local_hits_total', 'counter', "Hits in this worker's in-memory cache.", stats['hits']),
+        ('cache_local_misses_total', 'counter', "Misses in this worker's in-memory cache.", stats['misses']),
+        ('cache_local_evictions_total', 'counter', "Evictions from this worker's in-memory cache.",
+         stats['evictions']),
+    )
+    return app.response_class(text, mimetype='text/plain; version=0.0.4')
+
+
+def admin_niceties_query():
+    """The niceties shown to admins: those for batches ending within three weeks."""
+    return (Nicety.query
+            .filter(Nicety.end_date > datetime.now() - timedelta(days=ADMIN_WINDOW_DAYS))
+            .filter(Nicety.end_date < datetime.now() + timedelta(days=ADMIN_WINDOW_DAYS)))
+
+
 @app.route('/api/v1/admin-edit-niceties', methods=['GET'])
 @needs_authorization
 def get_admin_niceties():
-    ret = {}    # Mapping from target_id to a list of niceties for that person
-    last_target = None
     is_admin = util.admin_access(current_user())
-    three_weeks_ago = datetime.now() - timedelta(days=21)
-    three_weeks_from_now = datetime.now() + timedelta(days=21)
     if is_admin is True:
-        valid_niceties = (Nicety.query
-                          .filter(Nicety.end_date > three_weeks_ago)
-                          .filter(Nicety.end_date < three_weeks_from_now)
-                          .order_by(Nicety.target_id)
-                          .all())
-        for n in valid_niceties:
-            if n.target_id != last_target:
-                # ... set up the test for the next one
-                last_target = n.target_id
-                ret[n.target_id] = []  # initialize the dictionary
-            if n.anonymous is False:
-                ret[n.target_id].append({
-                    'author_id': n.author_id,
-                    'name': cache_person_call(n.author_id)['full_name'],
-                    'end_date': n.end_date,
-                    'no_read': n.no_read,
-                    'text': util.decode_str(n.text),
-                })
-            else:
-                ret[n.target_id].append({
+        in_window = admin_niceties_query()
+        if page_requested():
+            # A person's niceties may be split across pages, each page listing
+            # them under the same to_id
+            valid_niceties, cursor = paginate(in_window)
+            groups = {}
+            for n in valid_niceties:
+                groups.setdefault(n.target_id, []).append({
                     'author_id': n.author_id,
                     'end_date': n.end_date,
+                    'anonymous': n.anonymous,
                     'no_read': n.no_read,
-                    'text': util.decode_str(n.text),
+                    'text': n.text,
                 })
-        return jsonify([
-            {
-                'to_name': cache_person_call(k)['full_name'],
-                'to_id': cache_person_call(k)['id'],
-                'niceties': v
-            }
-            for k, v in ret.items()
-        ])
+            groups = list(groups.items())
+        else:
+            cursor = None
+            groups = nicety_groups(
+                in_window, Nicety.target_id, [Nicety.target_id], [Nicety.end_date, Nicety.id]).all()
+            for _, niceties in groups:
+                for n in niceties:
+                    n['end_date'] = datetime.strptime(n['end_date'], '%Y-%m-%d').date()
+        people = resolve_people(
+            set(target_id for target_id, _ in groups) |
+            set(n['author_id'] for _, niceties in groups for n in niceties if n['anonymous'] is False),
+            set(n['end_date'] for _, niceties in groups for n in niceties))
+        ret = []
+        for target_id, niceties in groups:
+            page = []
+            for n in niceties:
+                nicety = {
+                    'author_id': n['author_id'],
+                    'end_date': n['end_date'],
+                    'no_read': n['no_read'],
+                    'text': util.decode_str(n['text']),
+                }
+                if n['anonymous'] is False:
+                    nicety['name'] = people[n['author_id']]['full_name']
+                page.append(nicety)
+            ret.append({
+                'to_name': people[target_id]['full_name'],
+                'to_id': people[target_id]['id'],
+                'niceties': page,
+            })
+        return jsonify(ret), page_headers(cursor)
     else:
         return jsonify({'authorized': "false"})
 
 
+@app.route('/api/v1/admin-search-niceties', methods=['GET'])
+@needs_authorization
+def search_admin_niceties():
+    """Niceties matching the web-search style query `q` (e.g. `pairing -rust`),
+    optionally only those for the batch ending on `end_date` or from `author_id`
+    or to `target_id`. Paginated as by `paginate`."""
+    if not util.admin_access(current_user()):
+        return jsonify({'authorized': "false"})
+    query = Nicety.query.filter(Nicety.text.isnot(None))
+    if request.args.get('q', '').strip():
+        query = query.filter(Nicety.search_vector.op('@@')(
+            func.websearch_to_tsquery(SEARCH_CONFIG, request.args['q'])))
+    if request.args.get('end_date'):
+        try:
+            end_date = datetime.strptime(request.args['end_date'], '%Y-%m-%d').date()
+        except ValueError:
+            return abort(400, description='end_date must be formatted YYYY-MM-DD')
+        query = query.filter(Nicety.end_date == end_date)
+    if request.args.get('author_id', type=int) is not None:
+        query = query.filter(Nicety.author_id == request.args.get('author_id', type=int))
+    if request.args.get('target_id', type=int) is not None:
+        query = query.filter(Nicety.target_id == request.args.get('target_id', type=int))
+    niceties, cursor = paginate(query, always=True)
+    people = resolve_people(
+        set(n.target_id for n in niceties) | set(n.author_id for n in niceties if n.anonymous is False),
+        set(n.end_date for n in niceties if n.end_date is not None))
+    ret = []
+    for n in niceties:
+        match = {
+            'id': n.id,
+            'author_id': n.author_id,
+            'to_id': n.target_id,
+            'to_name': people[n.target_id]['full_name'],
+            'end_date': n.end_date,
+            'anonymous': n.anonymous,
+            'no_read': n.no_read,
+            'text': util.decode_str(n.text),
+        }
+        if n.anonymous is False:
+            match['name'] = people[n.author_id]['full_name']
+        ret.append(match)
+    return jsonify(ret), page_headers(cursor)
+
+
+def niceties_from_me_query():
+    return Nicety.query.filter(Nicety.author_id == current_user().id)
+
+
+def niceties_from_me_version():
+    pending = pending_saves.pending(current_user().id)
+    return (nicety_versions(niceties_from_me_query()),
+            sorted(repr((row['target_id'], row['end_date'], row['date_updated'])) for row in pending))
+
+
 @app.route('/api/v1/niceties-from-me')
 @needs_authorization
+@conditional(niceties_from_me_version)
+@query_budget(1)
 def niceties_from_me():
-    user_id = current_user().id
-    niceties = (Nicety.query
-                .filter(Nicety.author_id == user_id)
-                .all())
-    ret = [{
-        'target_id': n.target_id,
-        'text': util.decode_str(n.text),
+    """The current user's niceties, including saves this worker has not yet
+    written to the database. When a page is requested, pending saves only
+    replace niceties on that page."""
+    niceties, cursor = paginate(niceties_from_me_query())
+    ret = OrderedDict()
+    for n in niceties:
+        ret[(n.target_id, n.end_date)] = {
+            'target_id': n.target_id,
+            'text': util.decode_str(n.text),
+            'anonymous': n.anonymous,
+            'no_read': n.no_read,
+            'date_updated': n.date_updated
+        }
+    for row in pending_saves.pending(current_user().id):
+        if (row['target_id'], row['end_date']) in ret or not page_requested():
+            ret[(row['target_id'], row['end_date'])] = {
+                'target_id': row['target_id'],
+                'text': util.decode_str(row['text']),
+                'anonymous': row['anonymous'],
+                'no_read': row['no_read'],
+                'date_updated': row['date_updated']
+            }
+    return jsonify(list(ret.values())), page_headers(cursor)
+
+
+def niceties_for_me_query():
+    if app.config.get("DEBUG_SHOW_ALL") == "TRUE":
+        return Nicety.query
+    return (Nicety.query
+            # show niceties one day after the end date; the arithmetic is kept off
+            # the column so that the (target_id, end_date) index can be used
+            .filter(Nicety.end_date < datetime.now() - timedelta(days=1))
+            .filter(Nicety.target_id == current_user().id))
+
+
+def nicety_for_me(n, people):
+    """The recipient's view of the nicety `n`, given the profiles in `people`."""
+    if n.anonymous is True:
+        return {
+            'end_date': n.end_date,
+            'anonymous': n.anonymous,
+            'text': util.decode_str(n.text),
+            'no_read': n.no_read,
+            'date_updated': n.date_updated
+        }
+    return {
+        'avatar_url': people[n.author_id]['avatar_url'],
+        'name': people[n.author_id]['name'],
+        'author_id': n.author_id,
+        'end_date': n.end_date,
         'anonymous': n.anonymous,
+        'text': util.decode_str(n.text),
         'no_read': n.no_read,
         'date_updated': n.date_updated
-    } for n in niceties]
-    return jsonify(ret)
+    }
 
 
 @app.route('/api/v1/niceties-for-me')
 @needs_authorization
+@conditional(lambda: nicety_versions(niceties_for_me_query()))
 def niceties_for_me():
     ret = []
-    whoami = current_user().id
-    if app.config.get("DEBUG_SHOW_ALL") == "TRUE":
-        valid_niceties = (Nicety.query
-                          .all())
-    else:
-        valid_niceties = (Nicety.query
-                          .filter(Nicety.end_date + timedelta(days=1) < datetime.now())  # show niceties one day after the end date
-                          .filter(Nicety.target_id == whoami)
-                          .all())
+    valid_niceties, cursor = paginate(niceties_for_me_query())
+    people = resolve_people(
+        set(n.author_id for n in valid_niceties if n.text is not None and n.anonymous is not True),
+        set(n.end_date for n in valid_niceties if n.end_date is not None))
     for n in valid_niceties:
         if n.text is not None:
-            if n.anonymous is True:
-                store = {
-                    'end_date': n.end_date,
-                    'anonymous': n.anonymous,
-                    'text': util.decode_str(n.text),
-                    'no_read': n.no_read,
-                    'date_updated': n.date_updated
-                }
-            else:
-                store = {
-                    'avatar_url': cache_person_call(n.author_id)['avatar_url'],
-                    'name': cache_person_call(n.author_id)['name'],
-                    'author_id': n.author_id,
-                    'end_date': n.end_date,
-                    'anonymous': n.anonymous,
-                    'text': util.decode_str(n.text),
-                    'no_read': n.no_read,
-                    'date_updated': n.date_updated
-                }
-            ret.append(store)
-    return jsonify(ret)
+            ret.append(nicety_for_me(n, people))
+    return jsonify(ret), page_headers(cursor)
+
+
+def parse_watermark(value):
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    abort(400, description='since must be a watermark returned by an earlier request')
+
+
+def changes_since(query, entered=None):
+    """Returns the niceties matched by the `Nicety` `query` which have changed
+    since the watermark in the `since` parameter (all of them if there is none),
+    in the order they changed, and the watermark for the next request. Niceties
+    which have come into the query's scope since then without being saved,
+    such as by the date passing a cutoff, are matched by the optional
+    `entered(since)` condition. Watermarks lag the clock by
+    `DELTA_SETTLE_SECONDS`, so that saves still being committed are not missed;
+    the same change may therefore be sent more than once."""
+    watermark = (db.session.query(func.localtimestamp()).scalar() -
+                 timedelta(seconds=app.config['DELTA_SETTLE_SECONDS']))
+    if request.args.get('since'):
+        since = parse_watermark(request.args['since'])
+        changed = Nicety.updated_at > since
+        if entered is not None:
+            changed = or_(changed, entered(since))
+        query = query.filter(changed)
+        watermark = max(watermark, since)
+    return query.order_by(None).order_by(Nicety.updated_at, Nicety.id).all(), watermark
+
+
+def change_entry(n, **fields):
+    """An entry of a changes feed for the nicety `n`. A nicety which has been
+    blanked is sent as a tombstone, without `fields`."""
+    entry = {
+        'id': n.id,
+        'end_date': n.end_date,
+        'updated_at': n.updated_at.isoformat(),
+        'deleted': n.text is None,
+    }
+    if n.text is not None:
+        entry.update(fields)
+    return entry
+
+
+@app.route('/api/v1/admin-edit-niceties/changes', methods=['GET'])
+@needs_authorization
+def get_admin_nicety_changes():
+    """The niceties shown by `get_admin_niceties` which have changed since the
+    `since` watermark, as described by `changes_since`."""
+    if not util.admin_access(current_user()):
+        return jsonify({'authorized': "false"})
+    niceties, watermark = changes_since(
+        admin_niceties_query(),
+        # batches come into the window as their end date nears
+        lambda since: Nicety.end_date >= since + timedelta(days=ADMIN_WINDOW_DAYS))
+    people = resolve_people(
+        set(n.target_id for n in niceties) |
+        set(n.author_id for n in niceties if n.text is not None and n.anonymous is False),
+        set(n.end_date for n in niceties))
+    changes = []
+    for n in niceties:
+        fields = {
+            'to_name': people[n.target_id]['full_name'],
+            'author_id': n.author_id,
+            'no_read': n.no_read,
+            'text': util.decode_str(n.text),
+        }
+        if n.text is not None and n.anonymous is False:
+            fields['name'] = people[n.author_id]['full_name']
+        changes.append(dict(change_entry(n, **fields), to_id=n.target_id))
+    return jsonify({'watermark': watermark.isoformat(), 'changes': changes})
+
+
+@app.route('/api/v1/niceties-for-me/changes')
+@needs_authorization
+def niceties_for_me_changes():
+    """The niceties shown by `niceties_for_me` which have changed since the
+    `since` watermark, as described by `changes_since`."""
+    niceties, watermark = changes_since(
+        niceties_for_me_query(),
+        # niceties are shown one day after their end date
+        lambda since: Nicety.end_date > since - timedelta(days=1))
+    people = resolve_people(
+        set(n.author_id for n in niceties if n.text is not None and n.anonymous is not True),
+        set(n.end_date for n in niceties if n.end_date is not None))
+    changes = [change_entry(n, **(nicety_for_me(n, people) if n.text is not None else {})) for n in niceties]
+    return jsonify({'watermark': watermark.isoformat(), 'changes': changes})
 
 
 @app.route('/api/v1/faculty')
 @needs_authorization
+@conditional(lambda: cached_version('faculty', get_current_faculty))
 def get_faculty():
     faculty = get_current_faculty()
     return jsonify(faculty)
 
 
 @app.route('/api/v1/batches')
+@conditional(lambda: cached_version('batches', cache_batches_call))
 def get_all_batches():
     batches = cache_batches_call()
     return jsonify(batches)
 
 
+def people_version():
+    return current_user().id, cached_version(ROSTER_KEY, get_roster, app.config['ROSTER_MAX_AGE'])
+
+
 @app.route('/api/v1/people')
 @needs_authorization
+@conditional(people_version)
 def display_people():
-    current = get_current_users()
-    people = partition_current_users(current)
+    people = get_roster()
     user_id = current_user().id
 
     leaving = [person for person in people['leaving'] if person['id'] != user_id]
@@ -278,51 +805,168 @@ def display_people():
     to_display = {
         'staying': staying,
         'leaving': leaving,
-        'faculty': get_current_faculty()
+        'faculty': people['faculty']
     }
 
     return jsonify(to_display)
 
 
+def search_vector(text):
+    """The value of `Nicety.search_vector` for the stored nicety text `text`."""
+    return func.to_tsvector(SEARCH_CONFIG, util.decode_str(text))
+
+
+def upsert_niceties(rows):
+    """Saves `rows`, a list of dicts of `Nicety` column values, in a single
+    `INSERT ... ON CONFLICT DO UPDATE` keyed on the (author_id, target_id,
+    end_date) unique constraint. Existing rows whose `date_updated` matches the
+    incoming one are left untouched. Each row's search vector is computed from
+    its text, and `updated_at` is set to the time of the transaction. Rows
+    carrying the time they were saved, as `saved_at`, only replace ones saved
+    earlier, so that buffered rows written out of order cannot overwrite newer
+    ones. The caller is responsible for committing."""
+    stamped = any('saved_at' in row for row in rows)
+    dated = [dict(row, search_vector=search_vector(row['text'])) for row in rows if row['end_date'] is not None]
+    if dated:
+        table = Nicety.__table__
+        stmt = postgresql.insert(table).values(dated)
+        changed = table.c.date_updated.is_distinct_from(stmt.excluded.date_updated)
+        if stamped:
+            changed = and_(changed, or_(table.c.saved_at.is_(None), table.c.saved_at < stmt.excluded.saved_at))
+        values = {
+            'anonymous': stmt.excluded.anonymous,
+            'text': stmt.excluded.text,
+            'no_read': stmt.excluded.no_read,
+            'date_updated': stmt.excluded.date_updated,
+            'search_vector': stmt.excluded.search_vector,
+            'updated_at': func.now(),
+        }
+        if stamped:
+            values['saved_at'] = stmt.excluded.saved_at
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.author_id, table.c.target_id, table.c.end_date],
+            set_=values,
+            where=changed)
+        db.session.execute(stmt)
+    # NULLs never conflict with each other, so rows without an end date can't
+    # go through the upsert above. Instead the existing ones are looked up
+    # together, then updated and inserted with one statement each.
+    undated = {(row['author_id'], row['target_id']): row for row in rows if row['end_date'] is None}
+    if undated:
+        table = Nicety.__table__
+        existing = (db.session
+                    .query(Nicety.id, Nicety.author_id, Nicety.target_id)
+                    .filter(Nicety.end_date.is_(None))
+                    .filter(tuple_(Nicety.author_id, Nicety.target_id).in_(list(undated)))
+                    .all())
+        if existing:
+            update = table.update().where(table.c.id == bindparam('nicety_id'))
+            values = {
+                'anonymous': bindparam('new_anonymous'),
+                'text': bindparam('new_text'),
+                'no_read': bindparam('new_no_read'),
+                'date_updated': bindparam('new_date_updated'),
+                'search_vector': func.to_tsvector(SEARCH_CONFIG, bindparam('new_plain_text')),
+                'updated_at': func.now(),
+            }
+            if stamped:
+                update = update.where(or_(table.c.saved_at.is_(None), table.c.saved_at < bindparam('new_saved_at')))
+                values['saved_at'] = bindparam('new_saved_at')
+            db.session.execute(
+                update.values(values),
+                [{
+                    'nicety_id': nicety_id,
+                    'new_anonymous': undated[(author_id, target_id)]['anonymous'],
+                    'new_text': undated[(author_id, target_id)]['text'],
+                    'new_plain_text': util.decode_str(undated[(author_id, target_id)]['text']),
+                    'new_no_read': undated[(author_id, target_id)]['no_read'],
+                    'new_date_updated': undated[(author_id, target_id)]['date_updated'],
+                    'new_saved_at': undated[(author_id, target_id)].get('saved_at'),
+                } for nicety_id, author_id, target_id in existing])
+        found = set((author_id, target_id) for _, author_id, target_id in existing)
+        new = [dict(row, search_vector=search_vector(row['text']))
+               for key, row in undated.items() if key not in found]
+        if new:
+            db.session.execute(table.insert().values(new))
+
+
+def write_niceties(rows):
+    try:
+        upsert_niceties(rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+# Saves waiting to be written, when SAVE_COALESCE_SECONDS is set
+pending_saves = WriteBehindBuffer(app.config['SAVE_COALESCE_SECONDS'], write_niceties)
+
+
+def as_bool(n, field, default=None):
+    """The optional boolean `field` of the saved nicety `n`, which may also be
+    sent as 'true' or 'false'."""
+    value = n.get(field, default)
+    if isinstance(value, str) and value in ('true', 'false'):
+        return value == 'true'
+    if value is not None and not isinstance(value, bool):
+        abort(400, description='{} must be true or false'.format(field))
+    return value
+
+
+def nicety_row(n, user):
+    """The `Nicety` column values for the nicety `n` saved by `user`. Saves may be
+    written later by the write-behind buffer, so anything that could not be
+    stored is rejected here with a 400."""
+    if not isinstance(n, dict):
+        abort(400, description='niceties must be objects')
+    target_id = n.get('target_id')
+    if isinstance(target_id, str) and target_id.isdigit():
+        target_id = int(target_id)
+    if isinstance(target_id, bool) or not isinstance(target_id, int) or not 0 < target_id < 2 ** 31:
+        abort(400, description='target_id must be an RC user id')
+    end_date = None
+    if n.get('end_date'):
+        try:
+            end_date = datetime.strptime(n['end_date'], '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            abort(400, description='end_date must be formatted YYYY-MM-DD')
+    text = n.get('text')
+    if not isinstance(text, str):
+        abort(400, description='text must be a string')
+    text = text.strip()
+    date_updated = n.get('date_updated')
+    if date_updated is not None and not isinstance(date_updated, str):
+        abort(400, description='date_updated must be a string')
+    return {
+        'end_date': end_date,
+        'author_id': user.id,
+        'target_id': target_id,
+        'anonymous': as_bool(n, 'anonymous', user.anonymous_by_default),
+        'starred': False,
+        'text': util.encode_str(text) if text else None,
+        'no_read': as_bool(n, 'no_read'),
+        'date_updated': date_updated,
+    }
+
+
 @app.route('/api/v1/save-niceties', methods=['POST'])
 @needs_authorization
+@query_budget(4)
 def save_niceties():
     niceties_to_save = request.get_json()
-    for n in niceties_to_save["niceties"]:
-        if n.get('end_date'):
-            end_date = datetime.strptime(n.get("end_date"), "%Y-%m-%d").date()
-        else:
-            end_date = None
-        nicety = (
-            Nicety
-            .query      # Query is always about getting Nicety objects from the database
-            .filter_by(
-                end_date=end_date,
-                target_id=n.get("target_id"),
-                author_id=current_user().id)
-            .one_or_none())
-        if nicety is None:
-            nicety = Nicety(
-                end_date=end_date,
-                target_id=n.get("target_id"),
-                author_id=current_user().id)
-            db.session.add(nicety)
-            # We need to add for the new one, but we don't need to add where we have used .query
-            # Now any change to the nicety object (variable) is tracked by the object
-            # so it knows what it will have to update.
-            # And then when we call db.session.commit() that knows about the object
-            # (beacuse Nicety.query... uses the db.session behind the scenes).
-            # So then db.session.commit() sends the update (or insert) for every object
-            # in the session. This includes every object created by a [model].query and
-            # everything added to the session with db.session.add().
-        nicety.anonymous = n.get("anonymous", current_user().anonymous_by_default)
-        text = util.encode_str(n.get("text").strip())
-        if '' == text:
-            text = None
-        nicety.text = text
-        nicety.no_read = n.get("no_read")
-        nicety.date_updated = n.get("date_updated")
-    db.session.commit()
+    if not isinstance(niceties_to_save, dict) or not isinstance(niceties_to_save.get('niceties'), list):
+        abort(400, description='Expected an object with a list of niceties')
+    user = current_user()
+    rows = {}   # Keyed like the unique constraint, so the last copy of a nicety wins
+    for n in niceties_to_save['niceties']:
+        row = nicety_row(n, user)
+        rows[(row['target_id'], row['end_date'])] = row
+    if app.config['SAVE_COALESCE_SECONDS'] > 0:
+        now = datetime.now()
+        pending_saves.add([dict(row, saved_at=now) for row in rows.values()])
+    else:
+        write_niceties(list(rows.values()))
     return jsonify({'status': 'OK'})
 
 
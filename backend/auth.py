@@ -1,13 +1,13 @@
 import os
 import sys
 from functools import wraps
+from threading import Lock
 from time import time
 
 import flask_oauthlib
-import requests
-from backend import app, db, rc, util
+from backend import app, db, rc, rcclient, util
 from backend.models import User
-from flask import json, redirect, request, session, url_for
+from flask import g, has_request_context, json, redirect, request, session, url_for
 from werkzeug.exceptions import HTTPException
 
 
@@ -55,44 +55,91 @@ def authorized():
     elif user.faculty != util.profile_is_faculty(me):
         user.faculty = util.profile_is_faculty(me)
         db.session.commit()
+    session.pop('user', None)   # any snapshot of a previous login is stale
     session['user_id'] = user.id
     return redirect(url_for('home'))
 
 
 @rc.tokengetter
 def get_oauth_token():
+    if not has_request_context():
+        # Background tasks and CLI commands have no user session to borrow a
+        # token from, so they use a personal access token instead.
+        if app.config.get('RC_API_TOKEN') is None:
+            raise RuntimeError('RC_API_TOKEN must be set to call the RC API outside of a request')
+        return (app.config.get('RC_API_TOKEN'), '')
     token = session.get('rc_token')
     if time() > token['expires_at']:
-        data = {
-            'grant_type': 'refresh_token',
-            'client_id': rc.consumer_key,
-            'client_secret': rc.consumer_secret,
-            'redirect_uri': 'ietf:wg:oauth:2.0:oob',
-            'refresh_token': token['refresh_token']
-        }
-        resp = requests.post('https://www.recurse.com/oauth/token', data=data)
-        data = resp.json()
-        session['rc_token'] = {
-            'access_token': data['access_token'],
-            'refresh_token': data['refresh_token'],
-            'expires_at': data['expires_in'] + time() - 600
-        }
-        return (data['access_token'], '')
-    else:
-        return (token['access_token'], '')
-
-
-_current_user_memo = None
+        # Concurrent RC API calls made for this request (see
+        # util.call_concurrently) share its session, and a refresh token can
+        # only be used once, so only one of them refreshes it
+        with _refresh_lock:
+            token = session.get('rc_token')
+            if time() > token['expires_at']:
+                token = _refresh_token(token)
+    return (token['access_token'], '')
+
+
+_refresh_lock = Lock()
+
+
+def _refresh_token(token):
+    data = {
+        'grant_type': 'refresh_token',
+        'client_id': rc.consumer_key,
+        'client_secret': rc.consumer_secret,
+        'redirect_uri': 'ietf:wg:oauth:2.0:oob',
+        'refresh_token': token['refresh_token']
+    }
+    resp = rcclient.session().post('https://www.recurse.com/oauth/token', data=data,
+                                   timeout=rcclient.timeout())
+    data = resp.json()
+    session['rc_token'] = {
+        'access_token': data['access_token'],
+        'refresh_token': data['refresh_token'],
+        'expires_at': data['expires_in'] + time() - 600
+    }
+    return session['rc_token']
+
+
+# The User fields kept in the session when USER_SESSION_SNAPSHOT is set
+USER_SNAPSHOT_FIELDS = ('id', 'name', 'avatar_url', 'faculty', 'anonymous_by_default',
+                        'autosave_timeout', 'autosave_enabled', 'random_seed')
+
+
+def _user_from_snapshot():
+    snapshot = session.get('user')
+    if snapshot is None or snapshot.get('id') != session.get('user_id'):
+        return None
+    user = User(snapshot['id'], snapshot['name'])
+    for field in USER_SNAPSHOT_FIELDS:
+        setattr(user, field, snapshot[field])
+    return user
+
+
+def _load_current_user():
+    user_id = session.get('user_id', None)
+    if user_id is None:
+        return None
+    if app.config['USER_SESSION_SNAPSHOT']:
+        user = _user_from_snapshot()
+        if user is not None:
+            return user
+    user = User.query.get(user_id)
+    if user is not None and app.config['USER_SESSION_SNAPSHOT']:
+        session['user'] = {field: getattr(user, field) for field in USER_SNAPSHOT_FIELDS}
+    return user
 
 
 def current_user():
-    global _current_user_memo
-    if session.get('user_id', None) is None:
-        _current_user_memo = None
-    elif _current_user_memo is None or _current_user_memo.id != session.get('user_id'):
-        _current_user_memo = User.query.get(session.get('user_id'))
-        db.session.expunge(_current_user_memo)
-    return _current_user_memo
+    """Returns the logged-in `User`, or None. The user is looked up at most once
+    per request and kept on `flask.g`. When `USER_SESSION_SNAPSHOT` is set, it is
+    instead read from a copy kept in the signed session cookie, which is taken at
+    the first lookup after logging in; such a user is not attached to the
+    database session, so changes to it are not saved."""
+    if 'current_user' not in g:
+        g.current_user = _load_current_user()
+    return g.current_user
 
 
 def needs_authorization(f):
@@ -1,54 +1,228 @@
 import datetime
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
 
-from backend import config, db
+from backend import app, config, db, metrics, scheduler
 from backend.models import Cache
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
 
 
 class NotInCache(Exception):
     pass
 
 
-def get(key, max_age=None):
-    """Get a value from the cache, provided it is no  older than `max_age`, which
-    can be a `datetime.timedelta` or a number of seconds. If the item is not in the
-    cache, raises a `NotInCache` exception."""
+class LocalCache(object):
+    """A bounded, thread-safe, least-recently-used store kept in each worker
+    process in front of the `Cache` table. Each entry remembers when its value
+    was written to the `Cache` table, so it honors the same `max_age` as the
+    table does, and is also dropped `ttl` seconds after it was stored locally so
+    that workers pick up values written by other workers. Values are shared
+    between callers and must not be mutated."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, last_updated, expires)
+        self._lock = Lock()
+
+    def _lookup(self, key, oldest):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] < oldest or entry[2] < monotonic()):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                raise NotInCache
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def get(self, key, oldest):
+        """Return the value stored for `key` if it was last updated no earlier
+        than `oldest`, or raise `NotInCache`."""
+        return self._lookup(key, oldest)[0]
+
+    def last_updated(self, key, oldest):
+        """As `get`, but return when the value was written to the `Cache` table."""
+        return self._lookup(key, oldest)[1]
+
+    def set(self, key, value, last_updated):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, last_updated, monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+local = LocalCache(app.config['CACHE_LOCAL_SIZE'], app.config['CACHE_LOCAL_TTL'])
+
+
+def _oldest(max_age):
     if max_age is None:
         max_age = config.get(config.CACHE_TIMEOUT, datetime.timedelta(seconds=60 * 60 * 24))
     elif not isinstance(max_age, datetime.timedelta):
         max_age = datetime.timedelta(seconds=max_age)
+    return datetime.datetime.now() - max_age
+
+
+def get(key, max_age=None):
+    """Get a value from the cache, provided it is no  older than `max_age`, which
+    can be a `datetime.timedelta` or a number of seconds. If the item is not in the
+    cache, raises a `NotInCache` exception. The in-process `local` cache is
+    consulted before the `Cache` table."""
+    oldest = _oldest(max_age)
+    try:
+        return local.get(key, oldest)
+    except NotInCache:
+        pass
     db_row = Cache.query.filter(
         Cache.key == key,
-        Cache.last_updated >= (datetime.datetime.now() - max_age)).one_or_none()
+        Cache.last_updated >= oldest).one_or_none()
     if db_row is None:
         raise NotInCache
+    local.set(key, db_row.value, db_row.last_updated)
     return db_row.value
 
 
+def last_updated(key, max_age=None):
+    """Get the time at which the value cached for `key` was stored, without
+    loading the value itself. Raises `NotInCache` just as `get` does."""
+    oldest = _oldest(max_age)
+    try:
+        return local.last_updated(key, oldest)
+    except NotInCache:
+        pass
+    timestamp = (db.session
+                 .query(Cache.last_updated)
+                 .filter(Cache.key == key, Cache.last_updated >= oldest)
+                 .scalar())
+    if timestamp is None:
+        raise NotInCache
+    return timestamp
+
+
 def set(key, value):
-    """Set a value in the cache."""
-    db_row = Cache.query.filter_by(key=key).one_or_none()
-    if db_row is None:
-        db_row = Cache(key, value)
-        db.session.add(db_row)
-    else:
-        db_row.value = value
-    db_row.last_updated = datetime.datetime.now()
-    db.session.commit()
+    """Set a value in the cache. This is written on its own connection, so that
+    filling the cache part-way through a request does not commit (and expire)
+    whatever the request has pending in `db.session`."""
+    table = Cache.__table__
+    now = datetime.datetime.now()
+    with db.engine.begin() as connection:
+        updated = connection.execute(
+            table.update()
+            .where(table.c.key == key)
+            .values(value=value, last_updated=now)).rowcount
+        if updated == 0:
+            try:
+                with connection.begin_nested():
+                    connection.execute(table.insert().values(key=key, value=value, last_updated=now))
+            except IntegrityError:
+                # Another worker cached this key first; theirs is just as fresh
+                pass
+    local.set(key, value, now)
+
+
+def set_many(items):
+    """Set many values in the cache at once from a mapping of keys to values,
+    with a single statement on its own connection."""
+    if not items:
+        return
+    table = Cache.__table__
+    now = datetime.datetime.now()
+    stmt = postgresql.insert(table).values(
+        [{'key': key, 'value': value, 'last_updated': now} for key, value in items.items()])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.key],
+        set_={'value': stmt.excluded.value, 'last_updated': stmt.excluded.last_updated})
+    with db.engine.begin() as connection:
+        connection.execute(stmt)
+    for key, value in items.items():
+        local.set(key, value, now)
 
 
-def flush_expired(max_age=None):
+def get_or_set(key, compute, max_age=None):
+    """Get a value from the cache as with `get`. If the item is not in the cache,
+    or is older than `max_age`, call `compute()` to produce it, store the result
+    in the cache and return it."""
+    resource = key.split(':')[0]
+    try:
+        value = get(key, max_age)
+        metrics.cache_lookups.inc(resource, 'hit')
+        return value
+    except NotInCache:
+        metrics.cache_lookups.inc(resource, 'miss')
+        value = compute()
+        set(key, value)
+        return value
+
+
+def flush_expired(max_age=None, chunk_size=None):
     """Remove items from the cache which are older than `max_age`, which can be a
-    `datetime.timedelta` or a number of seconds."""
-    if max_age is None:
-        max_age = config.get(config.CACHE_TIMEOUT, datetime.timedelta(seconds=60 * 60 * 24))
-    elif not isinstance(max_age, datetime.timedelta):
-        max_age = datetime.timedelta(seconds=max_age)
-    (db
-     .session
-     .query(Cache)
-     .filter(Cache.last_updated >= (datetime.datetime.now() + max_age))
-     .delete())
-    db.session.commit()
+    `datetime.timedelta` or a number of seconds. Rows are deleted at most
+    `chunk_size` at a time, each chunk in its own transaction, so that the table
+    is never locked for long; rows locked by another sweeper are skipped.
+    Returns the number of rows deleted and the bytes of values they held."""
+    if chunk_size is None:
+        chunk_size = app.config['CACHE_SWEEP_CHUNK']
+    if chunk_size < 1:
+        raise ValueError('The cache sweep chunk size must be at least 1, not {}'.format(chunk_size))
+    table = Cache.__table__
+    expired = (select([table.c.key])
+               .where(table.c.last_updated < _oldest(max_age))
+               .limit(chunk_size)
+               .with_for_update(skip_locked=True))
+    sweep = (table.delete()
+             .where(table.c.key.in_(expired))
+             .returning(table.c.key, func.octet_length(table.c.value)))
+    rows = reclaimed = 0
+    while True:
+        with db.engine.begin() as connection:
+            deleted = connection.execute(sweep).fetchall()
+        for key, size in deleted:
+            local.discard(key)
+            reclaimed += size or 0
+        rows += len(deleted)
+        if len(deleted) < chunk_size:
+            return rows, reclaimed
+
+
+def sweep():
+    rows, reclaimed = flush_expired()
+    app.logger.info('Cache sweep removed %d expired rows (%d bytes)', rows, reclaimed)
+
+
+@app.before_first_request
+def start_cache_sweeper():
+    if app.config['CACHE_SWEEP_INTERVAL'] > 0:
+        scheduler.every(app.config['CACHE_SWEEP_INTERVAL'], sweep, 'cache-sweep')
 
 
 def flush_all():
@@ -58,3 +232,4 @@ def flush_all():
      .query(Cache)
      .delete())
     db.session.commit()
+    local.clear()
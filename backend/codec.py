@@ -0,0 +1,57 @@
+"""A compact, versioned encoding for the values kept in the `cache` and
+`site_configuration` tables. Values are JSON, extended with tagged objects for
+dates, datetimes and timedeltas, and are zlib-compressed when that is worth
+doing. The first byte of each encoded value says which of these formats the
+rest is in. Tuples come back as lists and dictionary keys must be strings."""
+import json
+import zlib
+from datetime import date, datetime, timedelta
+
+FORMAT_JSON = b'\x01'
+FORMAT_ZLIB_JSON = b'\x02'
+
+# Encoded values at least this many bytes long are compressed
+COMPRESS_THRESHOLD = 512
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def _encode_special(value):
+    if isinstance(value, datetime):
+        return {'$datetime': value.strftime(DATETIME_FORMAT)}
+    if isinstance(value, date):
+        return {'$date': value.strftime(DATE_FORMAT)}
+    if isinstance(value, timedelta):
+        return {'$timedelta': value.total_seconds()}
+    raise TypeError('Cannot encode {!r}'.format(value))
+
+
+def _decode_special(obj):
+    if len(obj) == 1:
+        if '$datetime' in obj:
+            return datetime.strptime(obj['$datetime'], DATETIME_FORMAT)
+        if '$date' in obj:
+            return datetime.strptime(obj['$date'], DATE_FORMAT).date()
+        if '$timedelta' in obj:
+            return timedelta(seconds=obj['$timedelta'])
+    return obj
+
+
+def dumps(value):
+    """Encode `value` as bytes."""
+    data = json.dumps(value, separators=(',', ':'), default=_encode_special).encode('utf-8')
+    if len(data) >= COMPRESS_THRESHOLD:
+        return FORMAT_ZLIB_JSON + zlib.compress(data)
+    return FORMAT_JSON + data
+
+
+def loads(data):
+    """Decode bytes produced by `dumps`."""
+    data = bytes(data)
+    version, payload = data[:1], data[1:]
+    if version == FORMAT_ZLIB_JSON:
+        payload = zlib.decompress(payload)
+    elif version != FORMAT_JSON:
+        raise ValueError('Unknown value encoding {!r}'.format(version))
+    return json.loads(payload.decode('utf-8'), object_hook=_decode_special)
@@ -0,0 +1,52 @@
+import click
+from backend import api, app, cache, maintenance, util
+from flask.cli import AppGroup
+
+roster_cli = AppGroup('roster', help='Manage the materialized people roster.')
+cache_cli = AppGroup('cache', help='Manage the cache of RC API results.')
+niceties_cli = AppGroup('niceties', help='Maintain the nicety table.')
+
+
+@roster_cli.command('refresh')
+def refresh_roster():
+    """Rebuild the staying/leaving/faculty roster snapshot."""
+    roster = api.refresh_roster()
+    click.echo('Roster refreshed: {} staying, {} leaving, {} faculty'.format(
+        len(roster['staying']), len(roster['leaving']), len(roster['faculty'])))
+
+
+@cache_cli.command('sweep')
+@click.option('--max-age', type=int, default=None,
+              help='Remove rows older than this many seconds (default: the site cache timeout).')
+@click.option('--chunk-size', type=click.IntRange(min=1), default=None,
+              help='Rows to delete per transaction.')
+def sweep_cache(max_age, chunk_size):
+    """Delete expired rows from the cache table."""
+    rows, reclaimed = cache.flush_expired(max_age, chunk_size)
+    click.echo('Cache swept: {} rows removed, {} bytes reclaimed'.format(rows, reclaimed))
+
+
+@cache_cli.command('warm')
+def warm_cache():
+    """Prefetch batches, open batch rosters, faculty and profiles from RC."""
+    counts = api.warm_cache()
+    click.echo('Cache warmed: {batches} batches, {rosters} rosters, {profiles} profiles'.format(**counts))
+
+
+@niceties_cli.command('reencode')
+@click.option('--to', 'encoding', type=click.Choice(util.TEXT_ENCODINGS), required=True,
+              help='The encoding to store nicety text in.')
+@click.option('--chunk-size', type=int, default=1000, help='Niceties to rewrite per transaction.')
+@click.option('--start-after', type=int, default=0, help='Resume after the nicety with this id.')
+def reencode_niceties(encoding, chunk_size, start_after):
+    """Convert stored nicety text to another encoding."""
+    def progress(stats):
+        click.echo('{done}/{total} niceties checked, {converted} converted (up to id {last_id})'.format(**stats))
+    stats = maintenance.reencode_niceties(encoding, chunk_size, start_after, progress)
+    click.echo('Re-encoding finished: {} of {} niceties converted, text went from {} to {} bytes'.format(
+        stats['converted'], stats['done'], stats['bytes_before'], stats['bytes_after']))
+
+
+app.cli.add_command(roster_cli)
+app.cli.add_command(cache_cli)
+app.cli.add_command(niceties_cli)
@@ -1,7 +1,6 @@
-from base64 import b64decode, b64encode
-
 from backend import db
-from backend.models import Nicety, SiteConfiguration
+from backend.maintenance import reencode_niceties
+from backend.models import SiteConfiguration
 
 # Configuration keys
 CACHE_TIMEOUT = 'default max age for cached data (datetime.timedelta)'
@@ -11,16 +10,21 @@ INCLUDE_RESIDENTS = 'permit niceties to be left about residents (boolean)'
 # Memo table for get() memoization
 memo = {}
 
+# Memoized in place of keys which are not in the table
+_MISSING = object()
+
 
 def get(key, default=None, memoized=True):
     """Get a configuration value from the SiteConfiguration table, returning
-    `default` if the value is not in the table. This value is memoized if it is
-    retreived from the database, making repeated calls cheap. Memoization can be
+    `default` if the value is not in the table. Whether or not it is found, the
+    result is memoized, making repeated calls cheap. Memoization can be
     bypassed by passing `memoized=False` as a parameter."""
     if memoized and key in memo:
-        return memo[key]
+        value = memo[key]
+        return default if value is _MISSING else value
     db_row = SiteConfiguration.query.filter(SiteConfiguration.key == key).one_or_none()
     if db_row is None:
+        memo[key] = _MISSING
         return default
     memo[key] = db_row.value
     return memo[key]
@@ -86,10 +90,5 @@ def set_to_default():
 
 
 def obfuscate_niceties():
-    for nicety in Nicety.query.all():
-        if nicety.text is not None:
-            encode = nicety.text.encode('utf-8')
-            new = b64encode(encode).decode('utf-8')
-            if nicety.text == b64decode(new).decode('utf-8'):
-                nicety.text = new
-    db.session.commit()
+    """Store the text of every nicety as base64, including legacy plain text."""
+    return reencode_niceties('base64')
@@ -0,0 +1,58 @@
+from backend import db, util
+from backend.models import Nicety
+from sqlalchemy import and_, bindparam, func, select
+
+
+def reencode_niceties(to, chunk_size=1000, start_after=0, progress=None):
+    """Converts the stored text of every nicety with an id above `start_after`
+    to the encoding `to` (one of `util.TEXT_ENCODINGS`), legacy plain text
+    included. Rows are streamed in id order through a server-side cursor and
+    rewritten a chunk at a time, each chunk in its own transaction, so the
+    table is never held in memory or locked all at once. Niceties already in
+    the target encoding are left alone, as are any saved again since they were
+    read, so an interrupted run can simply be started again, or resumed from
+    the `last_id` it reported. `progress`, if given, is called with the running
+    totals after each chunk, which are also returned."""
+    if to not in util.TEXT_ENCODINGS:
+        raise ValueError('Unknown nicety text encoding {!r}'.format(to))
+    table = Nicety.__table__
+    pending = and_(table.c.id > start_after, table.c.text.isnot(None))
+    update = (table.update()
+              .where(and_(table.c.id == bindparam('nicety_id'),
+                          table.c.text == bindparam('old_text')))
+              .values(text=bindparam('new_text')))
+    stats = {
+        'total': db.session.execute(select([func.count()]).where(pending)).scalar(),
+        'done': 0,
+        'converted': 0,
+        'bytes_before': 0,
+        'bytes_after': 0,
+        'last_id': start_after,
+    }
+    db.session.commit()
+    with db.engine.connect() as reader:
+        rows = (reader
+                .execution_options(stream_results=True)
+                .execute(select([table.c.id, table.c.text]).where(pending).order_by(table.c.id)))
+        while True:
+            chunk = rows.fetchmany(chunk_size)
+            if not chunk:
+                break
+            changes = []
+            for nicety_id, text in chunk:
+                new_text = text
+                if util.text_encoding(text) != to:
+                    new_text = util.encode_str(util.decode_str(text), to)
+                    changes.append({'nicety_id': nicety_id, 'old_text': text,
+                                    'new_text': new_text})
+                stats['bytes_before'] += len(text.encode('utf-8'))
+                stats['bytes_after'] += len(new_text.encode('utf-8'))
+            if changes:
+                with db.engine.begin() as writer:
+                    writer.execute(update, changes)
+            stats['done'] += len(chunk)
+            stats['converted'] += len(changes)
+            stats['last_id'] = chunk[-1][0]
+            if progress is not None:
+                progress(dict(stats))
+    return stats
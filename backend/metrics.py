@@ -0,0 +1,120 @@
+import re
+from threading import Lock
+from time import perf_counter
+
+# Upper bounds, in seconds, of the RC API latency histogram buckets
+RC_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter(object):
+    """A monotonically increasing count for each combination of label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Histogram(object):
+    """Counts observations into cumulative buckets for each combination of label
+    values, along with their sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels, buckets):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            counts = self._values.setdefault(label_values, [0] * len(self.buckets) + [0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {k: list(v) for k, v in self._values.items()}
+        for label_values, counts in sorted(values.items()):
+            labels = dict(zip(self.labels, label_values))
+            for bound, count in zip(self.buckets, counts):
+                yield self.name + '_bucket', dict(labels, le=repr(bound)), count
+            yield self.name + '_bucket', dict(labels, le='+Inf'), counts[-1]
+            yield self.name + '_sum', labels, counts[-2]
+            yield self.name + '_count', labels, counts[-1]
+
+
+rc_requests = Histogram(
+    'rc_api_request_duration_seconds', 'Time taken by requests to the RC API.',
+    ('endpoint', 'status'), RC_LATENCY_BUCKETS)
+cache_lookups = Counter(
+    'rc_api_cache_lookups_total', 'Lookups of RC API results in the cache, by resource and result.',
+    ('resource', 'result'))
+
+
+def endpoint_template(url):
+    """Returns `url` with ids replaced by a placeholder, e.g. `profiles/{id}`."""
+    return re.sub(r'\d+', '{id}', url)
+
+
+class InstrumentedRemoteApp(object):
+    """Wraps an RC remote app so that every `get` is timed and recorded in
+    `rc_requests`. Everything else is passed through to the wrapped app."""
+
+    def __init__(self, remote_app):
+        self._remote_app = remote_app
+
+    def get(self, url, *args, **kwargs):
+        start = perf_counter()
+        status = 'error'
+        try:
+            resp = self._remote_app.get(url, *args, **kwargs)
+            status = str(getattr(resp, 'status', 200))
+            return resp
+        finally:
+            rc_requests.observe(perf_counter() - start, endpoint_template(url), status)
+
+    def __getattr__(self, name):
+        return getattr(self._remote_app, name)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render(*extra_metrics):
+    """Returns every metric in Prometheus' text exposition format. The metrics
+    are those recorded by this worker process only. `extra_metrics` are
+    (name, kind, description, value) tuples for values sampled at render time."""
+    lines = []
+    for metric in (rc_requests, cache_lookups):
+        lines.append('# HELP {} {}'.format(metric.name, metric.description))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+        for name, labels, value in metric.samples():
+            label_text = ','.join('{}="{}"'.format(k, _escape(v)) for k, v in labels.items())
+            lines.append('{}{{{}}} {}'.format(name, label_text, value))
+    for name, kind, description, value in extra_metrics:
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        lines.append('{} {}'.format(name, value))
+    return '\n'.join(lines) + '\n'
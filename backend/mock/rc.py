@@ -1,26 +1,169 @@
-import os
+import random
 import re
+from collections import Counter
+from datetime import date, timedelta
+from threading import Lock
+from time import sleep
 from types import SimpleNamespace
 
-from backend import app
-from flask import json, redirect, url_for
+from flask import redirect, url_for
+
+WORDS = ('thank you for pairing with me on the compiler and for every thoughtful '
+         'question at presentations your energy made this batch brighter I learned '
+         'so much from watching you debug fearlessly keep being wonderful').split()
+
+FIRST_NAMES = ['Ada', 'Grace', 'Alan', 'Edsger', 'Barbara', 'Ken', 'Radia', 'Donald']
+
+
+class MockRCData(object):
+    """A generated RC community: `batches` batches of `people_per_batch` people
+    each, staggered by six weeks so that every batch overlaps with the next, plus
+    `faculty` faculty members. The two newest batches are open: one ends in a
+    few days and the other six weeks after that."""
+
+    def __init__(self, batches=10, people_per_batch=60, faculty=10, seed=0):
+        rng = random.Random(seed)
+        leaving_end = date.today() + timedelta(days=3)
+        self.batches = []   # oldest first
+        self.members = {}   # batch id -> list of person ids
+        self.profiles = {}  # person id -> RC profile
+        person_id = 1000
+        for i in range(batches):
+            end_date = leaving_end - timedelta(weeks=6 * (batches - 2 - i))
+            batch = {
+                'id': i + 1,
+                'name': 'Batch {}'.format(i + 1),
+                'start_date': (end_date - timedelta(weeks=12)).strftime('%Y-%m-%d'),
+                'end_date': end_date.strftime('%Y-%m-%d'),
+            }
+            self.batches.append(batch)
+            self.members[batch['id']] = []
+            for _ in range(people_per_batch):
+                self.profiles[person_id] = profile(person_id, rng, [{
+                    'type': 'retreat',
+                    'start_date': batch['start_date'],
+                    'end_date': batch['end_date'],
+                }])
+                self.members[batch['id']].append(person_id)
+                person_id += 1
+        self.faculty = []
+        for _ in range(faculty):
+            self.profiles[person_id] = profile(person_id, rng, [{
+                'type': 'employment',
+                'start_date': '2015-01-01',
+                'end_date': None,
+            }])
+            self.faculty.append(person_id)
+            person_id += 1
+
+    @property
+    def leaving(self):
+        return self.batches[-2]
+
+    @property
+    def staying(self):
+        return self.batches[-1]
+
+    @property
+    def me(self):
+        """The person who logs in: the first member of the staying batch."""
+        return self.profiles[self.members[self.staying['id']][0]]
+
+
+def profile(person_id, rng, stints):
+    return {
+        'id': person_id,
+        'first_name': rng.choice(FIRST_NAMES),
+        'last_name': 'Hacker{}'.format(person_id),
+        'image_path': 'https://placehold.it/400x400.jpg',
+        'bio_rendered': '<p>{}</p>'.format(' '.join(rng.choice(WORDS) for _ in range(60))),
+        'interests_rendered': '<p>{}</p>'.format(' '.join(rng.choice(WORDS) for _ in range(20))),
+        'interests_hl': ' '.join(rng.choice(WORDS) for _ in range(20)),
+        'before_rc_rendered': '<p>{}</p>'.format(' '.join(rng.choice(WORDS) for _ in range(40))),
+        'during_rc_rendered': '<p>{}</p>'.format(' '.join(rng.choice(WORDS) for _ in range(40))),
+        'employer_info_rendered': None,
+        'twitter': None,
+        'github': 'hacker{}'.format(person_id),
+        'stints': stints,
+    }
 
 
 class MockRCOAuthAPI(object):
-    url_matches = [
-        (re.compile('batches'), 'comments.json'),
-        (re.compile('people/me'), 'people_me.json'),
-        (re.compile('people/(\d+)'), 'people_me.json'),
-        (re.compile('batches/(\d+)/people'), 'batches_people.json'),
-    ]
-
-    def get(self, url):
-        for matcher in self.url_matches:
-            if matcher[0].fullmatch(url):
-                return SimpleNamespace(data=json.load(
-                    open(os.path.join(app.root_path, 'mock/fixtures/' + matcher[1]))
-                ))
-        return SimpleNamespace(data={})
+    """Stands in for the RC API remote app, answering the requests made by the
+    backend from a `MockRCData`. Each request sleeps for `latency` seconds, give
+    or take up to `jitter`, and fails with a 500 with probability `error_rate`.
+    The number of requests made to each endpoint is counted in `calls`."""
+
+    def __init__(self, data=None, latency=0, jitter=0, error_rate=0, seed=None):
+        self.data = data if data is not None else MockRCData()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self._lock = Lock()
+        self.url_matches = [
+            (re.compile(r'batches'), 'batches', self.batches),
+            (re.compile(r'profiles/me'), 'profiles/me', self.me),
+            (re.compile(r'profiles/(\d+)'), 'profiles/{id}', self.person),
+            (re.compile(r'profiles\?batch_id=(\d+)'), 'profiles?batch_id={id}', self.batch_profiles),
+            (re.compile(r'profiles\?role=faculty'), 'profiles?role=faculty', self.faculty),
+        ]
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a mock from the MOCK_RC_* settings in `config`."""
+        return cls(
+            data=MockRCData(
+                batches=config['MOCK_RC_BATCHES'],
+                people_per_batch=config['MOCK_RC_PEOPLE'],
+                faculty=config['MOCK_RC_FACULTY'],
+                seed=config['MOCK_RC_SEED']),
+            latency=config['MOCK_RC_LATENCY_MS'] / 1000,
+            jitter=config['MOCK_RC_JITTER_MS'] / 1000,
+            error_rate=config['MOCK_RC_ERROR_RATE'])
+
+    def get(self, url, *args, **kwargs):
+        for matcher, endpoint, handler in self.url_matches:
+            match = matcher.fullmatch(url)
+            if match:
+                break
+        else:
+            endpoint, handler, match = url, None, None
+        with self._lock:
+            self.calls[endpoint] += 1
+            delay = max(0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            failed = self.random.random() < self.error_rate
+        if delay:
+            sleep(delay)
+        if failed:
+            return SimpleNamespace(data={'message': 'Injected error'}, status=500)
+        if handler is None:
+            return SimpleNamespace(data={'message': 'Not found'}, status=404)
+        return handler(*match.groups())
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = Counter()
+
+    def batches(self):
+        return SimpleNamespace(data=list(reversed(self.data.batches)), status=200)
+
+    def me(self):
+        return SimpleNamespace(data=self.data.me, status=200)
+
+    def person(self, person_id):
+        p = self.data.profiles.get(int(person_id))
+        if p is None:
+            return SimpleNamespace(data={'message': 'Not found'}, status=404)
+        return SimpleNamespace(data=p, status=200)
+
+    def batch_profiles(self, batch_id):
+        members = self.data.members.get(int(batch_id), [])
+        return SimpleNamespace(data=[self.data.profiles[i] for i in members], status=200)
+
+    def faculty(self):
+        return SimpleNamespace(data=[self.data.profiles[i] for i in self.data.faculty], status=200)
 
     def authorize(self, callback=None, *args, **kwargs):
         if callback:
@@ -30,6 +173,8 @@ class MockRCOAuthAPI(object):
     def authorized_response(self, *args, **kwargs):
         return {
             'access_token': 'MOCK_ACCESS_TOKEN',
+            'refresh_token': 'MOCK_REFRESH_TOKEN',
+            'expires_in': 7200,
         }
 
     @staticmethod
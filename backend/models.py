@@ -1,7 +1,21 @@
 from datetime import datetime
 from os import urandom
 
-from backend import db
+from backend import codec, db
+from sqlalchemy.dialects import postgresql
+
+
+class CompactValue(db.TypeDecorator):
+    """A value stored in the compact, versioned encoding of `backend.codec`:
+    anything JSON can represent, plus dates, datetimes and timedeltas."""
+
+    impl = db.LargeBinary
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else codec.dumps(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else codec.loads(value)
 
 
 class User(db.Model):
@@ -43,8 +57,16 @@ class Nicety(db.Model):
     text = db.Column(db.Text, nullable=True)
     no_read = db.Column(db.Boolean)
     date_updated = db.Column(db.Text)
+    search_vector = db.Column(postgresql.TSVECTOR, nullable=True)  # of the decoded text
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(), index=True)
+    saved_at = db.Column(db.DateTime, nullable=True)  # when a buffered save was made
 
-    __table_args__ = (db.UniqueConstraint(author_id, target_id, end_date),)
+    __table_args__ = (
+        db.UniqueConstraint(author_id, target_id, end_date),
+        db.Index('ix_nicety_target_id_end_date', target_id, end_date, id),  # niceties for me, in page order
+        db.Index('ix_nicety_end_date_target_id', end_date, target_id),  # admin and print views
+        db.Index('ix_nicety_search_vector', search_vector, postgresql_using='gin'),  # admin search
+    )
 
     def __init__(self, end_date, author_id, target_id, **kwargs):
         self.end_date = end_date
@@ -64,7 +86,7 @@ class SiteConfiguration(db.Model):
     __tablename__ = 'site_configuration'
 
     key = db.Column(db.String(100), primary_key=True)
-    value = db.Column(db.PickleType)
+    value = db.Column(CompactValue)
 
     def __init__(self, key, value):
         self.key = key
@@ -78,8 +100,8 @@ class Cache(db.Model):
     __tablename__ = 'cache'
 
     key = db.Column(db.String(100), primary_key=True)
-    value = db.Column(db.PickleType)
-    last_updated = db.Column(db.DateTime)
+    value = db.Column(CompactValue)
+    last_updated = db.Column(db.DateTime, index=True)
 
     def __init__(self, key, value):
         self.key = key
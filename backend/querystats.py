@@ -0,0 +1,70 @@
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+
+from backend import app
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info['query_start_time'].pop()
+    if elapsed * 1000 > app.config['SQL_SLOW_MS']:
+        app.logger.warning('Slow SQL statement (%.0f ms): %s', elapsed * 1000, statement)
+    # Statements run outside of any request (e.g. by scheduled tasks) are not
+    # counted; those run for a request on a worker thread are added to its
+    # counts by merge_into
+    if has_request_context():
+        g.sql_queries = g.get('sql_queries', 0) + 1
+        g.sql_time = g.get('sql_time', 0) + elapsed
+
+
+_merge_lock = Lock()
+
+
+def merge_into(request_g):
+    """Adds the SQL statements counted in this thread's context to `request_g`,
+    the `g` of the request a worker thread has been running a call for."""
+    with _merge_lock:
+        request_g.sql_queries = request_g.get('sql_queries', 0) + g.get('sql_queries', 0)
+        request_g.sql_time = request_g.get('sql_time', 0) + g.get('sql_time', 0)
+
+
+@app.after_request
+def log_query_stats(response):
+    app.logger.debug('%s %s: %d SQL statements in %.1f ms', request.method, request.path,
+                     g.get('sql_queries', 0), g.get('sql_time', 0) * 1000)
+    return response
+
+
+def query_budget(limit):
+    """Decorates a view that should issue at most `limit` SQL statements itself
+    (not counting those made by decorators outside it, such as authorization).
+    Going over budget is logged, or raises `QueryBudgetExceeded` when testing or
+    when `SQL_ENFORCE_BUDGETS` is set, so that per-row queries in a loop are
+    caught before they reach production."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            before = g.get('sql_queries', 0)
+            rv = f(*args, **kwargs)
+            used = g.get('sql_queries', 0) - before
+            if used > limit:
+                message = '{} issued {} SQL statements, over its budget of {}'.format(f.__name__, used, limit)
+                if app.testing or app.config['SQL_ENFORCE_BUDGETS']:
+                    raise QueryBudgetExceeded(message)
+                app.logger.warning(message)
+            return rv
+        return decorated_function
+    return decorator
@@ -0,0 +1,63 @@
+import os
+from threading import Lock
+
+import requests
+from backend import app
+from flask_oauthlib.client import OAuthRemoteApp, prepare_request
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_session = None
+_session_pid = None
+_session_lock = Lock()
+
+
+def session():
+    """Returns this worker process's `requests.Session` for talking to RC, which
+    keeps up to `RC_HTTP_POOL_SIZE` connections alive between requests and
+    retries failed connections, and idempotent requests answered with a
+    gateway error, up to `RC_HTTP_RETRIES` times with exponential backoff."""
+    global _session, _session_pid
+    with _session_lock:
+        # Connections must not be shared with a forked child, so each worker
+        # process builds its own session
+        if _session is None or _session_pid != os.getpid():
+            retry = Retry(
+                total=app.config['RC_HTTP_RETRIES'],
+                backoff_factor=app.config['RC_HTTP_BACKOFF'],
+                status_forcelist=(502, 503, 504),
+                raise_on_status=False)
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=app.config['RC_HTTP_POOL_SIZE'],
+                max_retries=retry)
+            _session = requests.Session()
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session_pid = os.getpid()
+        return _session
+
+
+def timeout():
+    """The (connect, read) timeout in seconds for requests to RC."""
+    return (app.config['RC_CONNECT_TIMEOUT'], app.config['RC_READ_TIMEOUT'])
+
+
+class _Response(object):
+    """The parts of a `urllib` response that `flask_oauthlib` reads."""
+
+    def __init__(self, resp):
+        self.code = resp.status_code
+        self.headers = resp.headers
+
+
+class PooledRemoteApp(OAuthRemoteApp):
+    """An OAuth remote app whose requests, including token exchanges, go through
+    the pooled `session()` with timeouts instead of a new `urllib` connection
+    each time."""
+
+    @staticmethod
+    def http_request(uri, headers=None, data=None, method=None):
+        uri, headers, data, method = prepare_request(uri, headers, data, method)
+        resp = session().request(method, uri, headers=headers, data=data, timeout=timeout())
+        return _Response(resp), resp.content
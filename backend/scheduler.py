@@ -0,0 +1,21 @@
+import threading
+from time import sleep
+
+from backend import app
+
+
+def every(interval, f, name=None):
+    """Call `f` now and then every `interval` seconds on a daemon thread, inside
+    an application context. Exceptions are logged and do not stop the schedule.
+    Each worker process that calls this runs its own copy of the task."""
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    f()
+            except Exception:
+                app.logger.exception('Scheduled task %s failed', name or f.__name__)
+            sleep(interval)
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
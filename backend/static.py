@@ -1,16 +1,20 @@
 import os
 import re
-from collections import OrderedDict
 from datetime import datetime, timedelta
 
-from backend import app
-from backend.api import cache_person_call
+from backend import app, db
+from backend.api import nicety_groups, resolve_people
 from backend.auth import current_user, needs_authorization
 from backend.models import Nicety
 from backend.util import admin_access, decode_str
-from flask import abort, jsonify, render_template, send_file
+from flask import Response, abort, jsonify, send_file, stream_with_context
 from jinja2 import evalcontextfilter
 from markupsafe import Markup, escape
+from sqlalchemy import case
+
+# How many people's pages of niceties to fetch from the database at a time when
+# streaming them
+PAGES_PER_FETCH = 20
 
 
 @app.route('/')
@@ -45,50 +49,62 @@ def font():
     return send_file(os.path.realpath(os.path.join('SFPixelate-Bold.ttf')))
 
 
+def stream_template(template_name, **context):
+    """Render a template as a stream of chunks rather than one string, so that
+    the start of a long document reaches the browser while the rest is still
+    being queried and rendered."""
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(5)
+    return Response(stream_with_context(stream))
+
+
+def in_name_order(column, ids, people):
+    """Returns an ORDER BY expression putting rows in order of the full name of
+    the person whose id is in `column`, given the profiles in `people`."""
+    ranked = sorted(ids, key=lambda i: people[i]['full_name'])
+    if not ranked:
+        return column
+    return case({person_id: rank for rank, person_id in enumerate(ranked)}, value=column)
+
+
 @app.route('/niceties-by-sender')
 def niceties_by_sender():
-    ret = {}    # Mapping from author_id to a list of niceties from that person
     is_admin = admin_access(current_user())
     if is_admin is True:
-        valid_niceties = (Nicety.query
-                          .order_by(Nicety.author_id)
-                          .all())
-        last_author = None
-        for n in valid_niceties:
-            author = cache_person_call(n.author_id)['full_name']
-            if author != last_author:
-                # ... set up the test for the next one
-                last_author = author
-                ret[author] = []  # initialize the dictionary
-            if n.text is not None and n.text.isspace() is False:
-                if n.anonymous is False:
-                    ret[author].append({
-                        'target_id': n.target_id,
-                        'anon': False,
-                        'name': cache_person_call(n.target_id)['full_name'],
-                        'text': decode_str(n.text),
-                    })
-                else:
-                    ret[author].append({
-                        'target_id': n.target_id,
-                        'anon': True,
-                        'name': cache_person_call(n.target_id)['full_name'],
-                        'text': decode_str(n.text),
-                    })
-        ret = OrderedDict(sorted(ret.items(), key=lambda t: t[0]))
-        names = ret.keys()
-        data = []
-        for k, v in ret.items():
-            # sort by name, then sort by reverse author_id
-            data.append({
-                'to': k,
-                'niceties':
-                sorted(sorted(v, key=lambda k: k['name']), key=lambda k: k['anon'])
-            })
-        return render_template('nicetiesbyusers.html',
+        authors = [a for (a,) in db.session.query(Nicety.author_id).distinct()]
+        targets = [t for (t,) in db.session.query(Nicety.target_id).distinct()]
+        end_dates = [e for (e,) in db.session.query(Nicety.end_date).distinct() if e is not None]
+        people = resolve_people(set(authors) | set(targets), end_dates)
+        if authors == []:
+            groups = []
+        else:
+            # One row per author in name order, holding their niceties sorted
+            # by (anon, recipient name)
+            groups = (nicety_groups(Nicety.query,
+                                    Nicety.author_id,
+                                    [in_name_order(Nicety.author_id, authors, people), Nicety.author_id],
+                                    [Nicety.anonymous.isnot(False), in_name_order(Nicety.target_id, targets, people),
+                                     Nicety.id],
+                                    with_text_only=True)
+                      .yield_per(PAGES_PER_FETCH))
+
+        def pages():
+            for author_id, niceties in groups:
+                yield {
+                    'to': people[author_id]['full_name'],
+                    'niceties': [{
+                        'target_id': n['target_id'],
+                        'anon': n['anonymous'] is not False,
+                        'name': people[n['target_id']]['full_name'],
+                        'text': decode_str(n['text']),
+                    } for n in niceties]
+                }
+
+        return stream_template('nicetiesbyusers.html',
                                data={
-                                   'names': names,
-                                   'niceties': data
+                                   'names': sorted(set(people[a]['full_name'] for a in authors)),
+                                   'niceties': pages()
                                })
     else:
         return jsonify({'authorized': "false"})
@@ -96,51 +112,57 @@ def niceties_by_sender():
 
 @app.route('/print-niceties')
 def print_niceties():
-    ret = {}    # Mapping from target_id to a list of niceties for that person
     is_admin = admin_access(current_user())
     three_weeks_ago = datetime.now() - timedelta(days=21)
     three_weeks_from_now = datetime.now() + timedelta(days=21)
     if is_admin is True:
-        valid_niceties = (Nicety.query
-                          .filter(Nicety.end_date > three_weeks_ago)
-                          .filter(Nicety.end_date < three_weeks_from_now)
-                          .order_by(Nicety.target_id)
-                          .all())
-        last_target = None
-        for n in valid_niceties:
-            target = cache_person_call(n.target_id)['full_name']
-            if target != last_target:
-                # ... set up the test for the next one
-                last_target = target
-                ret[target] = []  # initialize the dictionary
-            if n.text is not None and n.text.isspace() is False:
-                if n.anonymous is False:
-                    ret[target].append({
-                        'author_id': n.author_id,
-                        'anon': False,
-                        'name': cache_person_call(n.author_id)['full_name'],
-                        'text': decode_str(n.text),
-                    })
-                else:
-                    ret[target].append({
-                        'anon': True,
-                        'name': "An Unknown Admirer",
-                        'text': decode_str(n.text),
-                    })
-        ret = OrderedDict(sorted(ret.items(), key=lambda t: t[0]))
-        names = ret.keys()
-        data = []
-        for k, v in ret.items():
-            # sort by name, then sort by reverse author_id
-            data.append({
-                'to': k,
-                'niceties':  # sorted(v, key=lambda k: k['name'])
-                sorted(sorted(v, key=lambda k: k['name']), key=lambda k: k['anon'])
-            })
-        return render_template('printniceties.html',
+        in_window = (Nicety.end_date > three_weeks_ago, Nicety.end_date < three_weeks_from_now)
+        targets = [t for (t,) in db.session.query(Nicety.target_id).filter(*in_window).distinct()]
+        authors = [a for (a,) in (db.session.query(Nicety.author_id)
+                                  .filter(*in_window)
+                                  .filter(Nicety.anonymous.is_(False))
+                                  .distinct())]
+        end_dates = [e for (e,) in db.session.query(Nicety.end_date).filter(*in_window).distinct()]
+        people = resolve_people(set(targets) | set(authors), end_dates)
+        if targets == []:
+            groups = []
+        else:
+            # One row per recipient in name order, holding their niceties with
+            # signed ones first, by author name, then anonymous ones
+            groups = (nicety_groups(Nicety.query.filter(*in_window),
+                                    Nicety.target_id,
+                                    [in_name_order(Nicety.target_id, targets, people), Nicety.target_id],
+                                    [Nicety.anonymous.isnot(False), in_name_order(Nicety.author_id, authors, people),
+                                     Nicety.id],
+                                    with_text_only=True)
+                      .yield_per(PAGES_PER_FETCH))
+
+        def pages():
+            for target_id, niceties in groups:
+                page = []
+                for n in niceties:
+                    if n['anonymous'] is False:
+                        page.append({
+                            'author_id': n['author_id'],
+                            'anon': False,
+                            'name': people[n['author_id']]['full_name'],
+                            'text': decode_str(n['text']),
+                        })
+                    else:
+                        page.append({
+                            'anon': True,
+                            'name': "An Unknown Admirer",
+                            'text': decode_str(n['text']),
+                        })
+                yield {
+                    'to': people[target_id]['full_name'],
+                    'niceties': page
+                }
+
+        return stream_template('printniceties.html',
                                data={
-                                   'names': names,
-                                   'niceties': data
+                                   'names': sorted(set(people[t]['full_name'] for t in targets)),
+                                   'niceties': pages()
                                })
     else:
         return jsonify({'authorized': "false"})
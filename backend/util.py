@@ -1,23 +1,20 @@
+import os
+import threading
+import zlib
 from base64 import b64decode, b64encode
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime, time
+from functools import partial
+from time import monotonic
 
-from backend import app
+from backend import app, querystats
+from flask import copy_current_request_context, g, has_request_context
+from werkzeug.exceptions import GatewayTimeout
 
-batch_closing_time_memo = {}
-batch_closing_warning_time_memo = {}
-
-
-def open_batches(end_date):
-    '''
-    Returns `True` if and only if the specified batch is currently accepting
-    niceties. The `end_date` should
-    be a datetime object or a string with format `%Y-%m-%d`.
-    '''
-    if not isinstance(end_date, datetime):
-        end_date = datetime.strptime(end_date, "%Y-%m-%d")
-    closing_time = datetime.combine(end_date, time(hour=10, minute=0))
-    now = datetime.now()
-    return (closing_time > now)
+# Niceties for a batch can be written until this time on its end date
+CLOSING_TIME = time(hour=10, minute=0)
 
 
 def name_from_rc_person(person):
@@ -34,20 +31,81 @@ def full_name_from_rc_person(person):
     return '{} {}'.format(person['first_name'], person['last_name'])
 
 
-def next_window(latest_batches):
+class BatchIndex(object):
     '''
-    Takes a list of the latest batches and determines how long more to
-    when the niceties window is open for writing.
+    The batches with an end date from a list of RC batches, with their end
+    dates parsed once and sorted by closing time, so that the lookups below
+    are bisections rather than scans of every batch ever run.
     '''
-    now = datetime.now()
-    earliest_end_date = None
-    for batch in latest_batches:
-        e = datetime.strptime(batch['end_date'], '%Y-%m-%d')
-        if earliest_end_date is None or e < earliest_end_date:
-            earliest_end_date = e
-    time_left = earliest_end_date - now
 
-    return time_left
+    def __init__(self, batches):
+        entries = sorted(
+            (datetime.strptime(batch['end_date'], '%Y-%m-%d'), position, batch)
+            for position, batch in enumerate(batches) if batch['end_date'])
+        self.end_dates = [end_date for end_date, _, _ in entries]
+        self.closing_times = [datetime.combine(end_date, CLOSING_TIME) for end_date in self.end_dates]
+        self.positions = [position for _, position, _ in entries]
+        self.batches = [batch for _, _, batch in entries]
+        self.distinct_end_dates = sorted(set(self.end_dates))
+        self.distinct_closing_times = [datetime.combine(end_date, CLOSING_TIME)
+                                       for end_date in self.distinct_end_dates]
+
+    def _first_open(self, now=None):
+        return bisect_right(self.closing_times, now or datetime.now())
+
+    def open_batches(self, now=None):
+        '''
+        Returns the batches still accepting niceties, which they do until
+        `CLOSING_TIME` on their end date, in the order they were given.
+        '''
+        i = self._first_open(now)
+        return [batch for _, batch in sorted(zip(self.positions[i:], self.batches[i:]),
+                                             key=lambda entry: entry[0])]
+
+    def next_window(self, now=None):
+        '''
+        Returns how long it is from `now` until the end date of the next batch
+        to close, or None if no batch is open.
+        '''
+        now = now or datetime.now()
+        i = self._first_open(now)
+        if i == len(self.end_dates):
+            return None
+        return self.end_dates[i] - now
+
+    def staying_and_leaving(self, now=None):
+        '''
+        Returns the end dates, as datetimes, of the batches staying on and
+        leaving: the leaving batch is the next to close, and the staying one
+        the batch closing after it. Batches which have not started yet close
+        later still, so are neither. Either date is None if there is no such
+        batch.
+        '''
+        i = bisect_right(self.distinct_closing_times, now or datetime.now())
+        dates = self.distinct_end_dates[i:i + 2] + [None, None]
+        return dates[1], dates[0]
+
+    def ending_around(self, end_dates):
+        '''
+        Returns the ids of the batches ending on any of `end_dates` (a collection
+        of `datetime.date`), together with the batches ending next after each of
+        those.
+        '''
+        wanted = set()
+        for end_date in end_dates:
+            end_date = datetime.combine(end_date, time())
+            i = bisect_left(self.distinct_end_dates, end_date)
+            if i < len(self.distinct_end_dates) and self.distinct_end_dates[i] == end_date:
+                wanted.update(self.distinct_end_dates[i:i + 2])
+            else:
+                wanted.update(self.distinct_end_dates[i:i + 1])
+        ids = []
+        for end_date in wanted:
+            i = bisect_left(self.end_dates, end_date)
+            while i < len(self.end_dates) and self.end_dates[i] == end_date:
+                ids.append(self.batches[i]['id'])
+                i += 1
+        return ids
 
 
 def profile_is_faculty(profile):
@@ -64,13 +122,131 @@ def admin_access(current_user):
         return False
 
 
-def encode_str(inp):
+# Prefixes marking the stored forms of nicety text; text without one is base64,
+# or else plain text saved before niceties were encoded
+TEXT_PREFIXES = {'raw': 't:', 'zlib': 'z:'}
+TEXT_ENCODINGS = ('base64', 'raw', 'zlib')
+
+
+def _from_base64(stored):
+    '''
+    Returns the text encoded as base64 in `stored`, or None if it is not
+    valid base64 of UTF-8 text.
+    '''
+    try:
+        return b64decode(stored, validate=True).decode('utf-8')
+    except ValueError:
+        return None
+
+
+def text_encoding(stored):
+    '''
+    Returns which of `TEXT_ENCODINGS` the stored nicety text `stored` is in, or
+    'plain' for legacy unencoded text. Base64 never contains a colon, so the
+    prefixes cannot be mistaken for it; plain text is anything else which is
+    not valid base64 of UTF-8 text.
+    '''
+    for encoding, prefix in TEXT_PREFIXES.items():
+        if stored.startswith(prefix):
+            return encoding
+    if _from_base64(stored) is None:
+        return 'plain'
+    return 'base64'
+
+
+def encode_str(inp, encoding=None):
+    '''
+    Returns nicety text in the form it is stored in: base64, raw text or
+    base64 of the zlib-compressed text, as chosen by `encoding` or else by the
+    `NICETY_TEXT_ENCODING` setting.
+    '''
     if inp is None:
         return None
-    return b64encode(inp.encode('utf-8')).decode('utf-8')
+    encoding = encoding or app.config['NICETY_TEXT_ENCODING']
+    if encoding == 'raw':
+        return TEXT_PREFIXES['raw'] + inp
+    elif encoding == 'zlib':
+        return TEXT_PREFIXES['zlib'] + b64encode(zlib.compress(inp.encode('utf-8'))).decode('utf-8')
+    elif encoding == 'base64':
+        return b64encode(inp.encode('utf-8')).decode('utf-8')
+    raise ValueError('Unknown nicety text encoding {!r}'.format(encoding))
 
 
 def decode_str(inp):
+    '''
+    Returns the text of a nicety stored in any of the forms `encode_str` makes,
+    or as legacy plain text.
+    '''
     if inp is None:
         return None
-    return b64decode(inp).decode('utf-8')
+    if inp.startswith(TEXT_PREFIXES['raw']):
+        return inp[len(TEXT_PREFIXES['raw']):]
+    elif inp.startswith(TEXT_PREFIXES['zlib']):
+        return zlib.decompress(b64decode(inp[len(TEXT_PREFIXES['zlib']):])).decode('utf-8')
+    text = _from_base64(inp)
+    return inp if text is None else text
+
+
+_executor = None
+_executor_pid = None
+_worker_state = threading.local()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    # Threads do not survive a fork, so each worker process gets its own pool
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(max_workers=app.config['RC_MAX_WORKERS'])
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _call_in_app_context(f):
+    with app.app_context():
+        return f()
+
+
+def _counted_for(request_g, f):
+    try:
+        return f()
+    finally:
+        querystats.merge_into(request_g)
+
+
+def _in_worker_context(f):
+    if has_request_context():
+        # The copied request context gets a `g` of its own, so the SQL
+        # statements it runs are passed back to the request's
+        f = copy_current_request_context(partial(_counted_for, g._get_current_object(), f))
+    else:
+        f = partial(_call_in_app_context, f)
+
+    def run():
+        _worker_state.in_pool = True
+        try:
+            return f()
+        finally:
+            _worker_state.in_pool = False
+    return run
+
+
+def call_concurrently(*functions):
+    '''
+    Calls each of `functions`, which take no arguments, on a bounded pool of
+    worker threads and returns their results as a list in the same order. Each
+    call runs in a copy of the current request (or application) context. Raises
+    `GatewayTimeout` if the calls have not all finished within `RC_DEADLINE`
+    seconds. When called from inside the pool the functions are run serially,
+    so that nested fan-outs cannot exhaust the pool and deadlock.
+    '''
+    if len(functions) <= 1 or getattr(_worker_state, 'in_pool', False):
+        return [f() for f in functions]
+    executor = _get_executor()
+    futures = [executor.submit(_in_worker_context(f)) for f in functions]
+    deadline = monotonic() + app.config['RC_DEADLINE']
+    try:
+        return [future.result(timeout=max(0, deadline - monotonic())) for future in futures]
+    except FutureTimeoutError:
+        for future in futures:
+            future.cancel()
+        raise GatewayTimeout(description='Timed out waiting for the RC API')
@@ -0,0 +1,73 @@
+import atexit
+import os
+from threading import Lock
+
+from backend import app, scheduler
+
+
+def nicety_key(row):
+    return (row['author_id'], row['target_id'], row['end_date'])
+
+
+class WriteBehindBuffer(object):
+    """Holds saved niceties in memory, keyed like their unique constraint, so
+    that repeated saves of a nicety collapse into its latest version. Every
+    `window` seconds the pending rows are handed to `write` (inside an
+    application context) in one batch, and whatever is pending is written
+    when the process exits normally. Each worker process keeps its own buffer,
+    so rows should be stamped with the time they were saved, letting `write`
+    avoid replacing a newer version written by another worker."""
+
+    def __init__(self, window, write):
+        self.window = window
+        self._write = write
+        self._pending = {}  # nicety_key -> row
+        self._lock = Lock()
+        self._flusher_pid = None
+
+    def add(self, rows):
+        with self._lock:
+            for row in rows:
+                self._pending[nicety_key(row)] = row
+            # The flusher thread does not survive a fork, so each worker
+            # process starts its own
+            if self._flusher_pid != os.getpid():
+                self._flusher_pid = os.getpid()
+                scheduler.every(self.window, self.flush, 'save-flush')
+                atexit.register(self.flush)
+
+    def pending(self, author_id):
+        """The rows saved by `author_id` which have not been written yet."""
+        with self._lock:
+            return [row for key, row in self._pending.items() if key[0] == author_id]
+
+    def flush(self):
+        """Write out every pending row, returning how many were written. If the
+        batch cannot be written the rows are retried one at a time, and any
+        that still fail are logged and dropped, so that one bad row cannot hold
+        up the rest. If none of them can be written the fault is not the rows',
+        so they are kept, unless they have been saved again since."""
+        with self._lock:
+            rows, self._pending = list(self._pending.values()), {}
+        if not rows:
+            return 0
+        with app.app_context():
+            try:
+                self._write(rows)
+                return len(rows)
+            except Exception:
+                app.logger.exception('Writing %d buffered rows failed, retrying them one at a time', len(rows))
+            failed = []
+            for row in rows:
+                try:
+                    self._write([row])
+                except Exception:
+                    failed.append(row)
+        if len(failed) == len(rows):
+            with self._lock:
+                for row in rows:
+                    self._pending.setdefault(nicety_key(row), row)
+            raise RuntimeError('None of the {} buffered rows could be written'.format(len(rows)))
+        for row in failed:
+            app.logger.error('Dropping buffered row %r, which could not be written', nicety_key(row))
+        return len(rows) - len(failed)
@@ -0,0 +1,78 @@
+"""Benchmark the backend against a synthetic population.
+
+Usage: python -m bench [options]
+
+DATABASE_URL must point at a scratch database which has been migrated with
+`flask db upgrade`; it is filled with synthetic data. The RC API is mocked out
+(see backend/mock/rc.py) with a community generated from the same options.
+"""
+import argparse
+import json
+import os
+from base64 import b64encode
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python -m bench', description=__doc__.split('\n')[0])
+    parser.add_argument('--batches', type=int, default=10, help='number of batches (default 10)')
+    parser.add_argument('--people', type=int, default=60, help='people per batch (default 60)')
+    parser.add_argument('--faculty', type=int, default=10, help='number of faculty (default 10)')
+    parser.add_argument('--density', type=float, default=1.0,
+                        help='fraction of possible niceties that are written (default 1.0)')
+    parser.add_argument('--anonymous-rate', type=float, default=0.2)
+    parser.add_argument('--no-read-rate', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the population')
+    parser.add_argument('--rc-latency-ms', type=float, default=0, help='latency of each RC API call')
+    parser.add_argument('--rc-jitter-ms', type=float, default=0, help='jitter in the latency of RC API calls')
+    parser.add_argument('--rc-error-rate', type=float, default=0, help='fraction of RC API calls which fail')
+    parser.add_argument('--iterations', type=int, default=20, help='warm requests per endpoint (default 20)')
+    parser.add_argument('--reset', action='store_true', help='replace existing data in the database')
+    parser.add_argument('--no-seed', action='store_true',
+                        help='reuse data seeded by an earlier run with the same population options')
+    parser.add_argument('--out', help='write results to this JSON file')
+    parser.add_argument('--compare', help='compare against results from an earlier --out file')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # The backend reads its settings from the environment when it is imported.
+    # DEV gives every user admin access, which the admin endpoints need.
+    os.environ.update({
+        'DEV': 'TRUE',
+        'MOCK_OUT_RC_API': 'TRUE',
+        'MOCK_RC_BATCHES': str(args.batches),
+        'MOCK_RC_PEOPLE': str(args.people),
+        'MOCK_RC_FACULTY': str(args.faculty),
+        'MOCK_RC_SEED': str(args.seed),
+        'MOCK_RC_LATENCY_MS': str(args.rc_latency_ms),
+        'MOCK_RC_JITTER_MS': str(args.rc_jitter_ms),
+        'MOCK_RC_ERROR_RATE': str(args.rc_error_rate),
+    })
+    os.environ.setdefault('FLASK_SECRET_KEY_B64', b64encode(os.urandom(24)).decode('ascii'))
+
+    from backend import app, rc
+    from bench import runner
+    from bench.dataset import Population
+
+    population = Population(
+        rc.data, density=args.density, anonymous_rate=args.anonymous_rate,
+        no_read_rate=args.no_read_rate, seed=args.seed)
+    if not args.no_seed:
+        with app.app_context():
+            runner.seed(population, reset=args.reset)
+    results = runner.run(population, args.iterations)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print(runner.report(results, previous))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'metadata': runner.metadata(population, args.iterations), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Synthetic niceties for the generated RC community served by the mock RC API."""
+import random
+
+from backend.mock.rc import WORDS
+
+
+class Population(object):
+    """The people of `rc_data` (a `backend.mock.rc.MockRCData`) and the niceties
+    they write: every person writes a nicety to each member of their own batch
+    and of the batch ending before theirs with probability `density`."""
+
+    def __init__(self, rc_data, density=1.0, anonymous_rate=0.2, no_read_rate=0.05, seed=0):
+        rng = random.Random(seed)
+        self.rc_data = rc_data
+        self.niceties = []
+        for previous, batch in zip([None] + rc_data.batches, rc_data.batches):
+            authors = rc_data.members[batch['id']]
+            if previous is not None:
+                # Those leaving are written to by the batch staying on after them
+                self.niceties.extend(
+                    nicety(rng, author_id, target_id, previous['end_date'], anonymous_rate, no_read_rate)
+                    for author_id in authors
+                    for target_id in rc_data.members[previous['id']]
+                    if rng.random() < density)
+            self.niceties.extend(
+                nicety(rng, author_id, target_id, batch['end_date'], anonymous_rate, no_read_rate)
+                for author_id in authors
+                for target_id in rc_data.members[batch['id']]
+                if author_id != target_id and rng.random() < density)
+
+    @property
+    def alumni(self):
+        """A batch which has already ended, if there is one."""
+        batches = self.rc_data.batches
+        return batches[-3] if len(batches) > 2 else batches[0]
+
+
+def nicety(rng, author_id, target_id, end_date, anonymous_rate, no_read_rate):
+    return {
+        'author_id': author_id,
+        'target_id': target_id,
+        'end_date': end_date,
+        'anonymous': rng.random() < anonymous_rate,
+        'no_read': rng.random() < no_read_rate,
+        'text': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 120))),
+        'date_updated': str(rng.randint(1, 10 ** 12)),
+    }
@@ -0,0 +1,151 @@
+"""Seeds the database from a `Population` and times the backend's endpoints
+against it."""
+import time
+from datetime import datetime
+
+from backend import app, cache, db, rc, util
+from backend.models import Cache, Nicety, User
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Rows per INSERT when seeding
+SEED_CHUNK = 5000
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+        event.listen(Engine, 'before_cursor_execute', self.count_query)
+
+    def count_query(self, *args, **kwargs):
+        self.count += 1
+
+
+def seed(population, reset=False):
+    """Fill the database with the people and niceties of `population`. Refuses
+    to touch a database which already has niceties in it unless `reset` is set,
+    in which case the nicety, user and cache tables are emptied first."""
+    if Nicety.query.first() is not None:
+        if not reset:
+            raise SystemExit('The database already has niceties in it; pass --reset to replace them')
+        Nicety.query.delete()
+        User.query.delete()
+        Cache.query.delete()
+        db.session.commit()
+    users = [{'id': person_id, 'name': p['first_name'], 'faculty': False, 'anonymous_by_default': False,
+              'autosave_timeout': 10, 'autosave_enabled': True, 'random_seed': b'\0' * 32}
+             for person_id, p in population.rc_data.profiles.items()]
+    niceties = [dict(n, text=util.encode_str(n['text']), starred=False) for n in population.niceties]
+    for table, rows in ((User.__table__, users), (Nicety.__table__, niceties)):
+        for i in range(0, len(rows), SEED_CHUNK):
+            db.session.execute(table.insert(), rows[i:i + SEED_CHUNK])
+    db.session.commit()
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def endpoints(population):
+    """Returns (name, user id, method, path, payload function) for each endpoint
+    to be timed. The payload function takes the iteration number."""
+    rc_data = population.rc_data
+    writer = rc_data.members[rc_data.staying['id']][0]
+    recipient = rc_data.members[population.alumni['id']][0]
+
+    def save_payload(i):
+        return {'niceties': [{
+            'target_id': target_id,
+            'end_date': rc_data.leaving['end_date'],
+            'text': 'You were a joy to pair with ({})'.format(i),
+            'anonymous': False,
+            'no_read': False,
+            'date_updated': str(i),
+        } for target_id in rc_data.members[rc_data.leaving['id']]]}
+
+    return [
+        ('save_niceties', writer, 'POST', '/api/v1/save-niceties', save_payload),
+        ('niceties_for_me', recipient, 'GET', '/api/v1/niceties-for-me', None),
+        ('get_admin_niceties', writer, 'GET', '/api/v1/admin-edit-niceties', None),
+        ('display_people', writer, 'GET', '/api/v1/people', None),
+        ('print_niceties', writer, 'GET', '/print-niceties', None),
+        ('niceties_by_sender', writer, 'GET', '/niceties-by-sender', None),
+    ]
+
+
+def run(population, iterations):
+    """Time each endpoint once with an empty cache and then `iterations` more
+    times with a warm one, returning a dict of results keyed by endpoint. The
+    RC API must be mocked out, so that its calls can be counted."""
+    queries = QueryCounter()
+    results = {}
+    for name, user_id, method, path, payload in endpoints(population):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+            session['rc_token'] = {'access_token': 'BENCH', 'refresh_token': 'BENCH',
+                                   'expires_at': time.time() + 24 * 60 * 60}
+        with app.app_context():
+            cache.flush_all()
+        samples = []
+        query_counts = []
+        rc_calls = []
+        for i in range(iterations + 1):
+            queries.count = 0
+            rc.reset_calls()
+            start = time.perf_counter()
+            if method == 'POST':
+                response = client.post(path, json=payload(i))
+            else:
+                response = client.get(path)
+            response.get_data()     # drain streamed responses
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise RuntimeError('{} returned {}'.format(path, response.status_code))
+            samples.append(elapsed)
+            query_counts.append(queries.count)
+            rc_calls.append(sum(rc.calls.values()))
+        cold, warm = samples[0], samples[1:]
+        results[name] = {
+            'cold_ms': cold * 1000,
+            'cold_queries': query_counts[0],
+            'cold_rc_calls': rc_calls[0],
+            'p50_ms': percentile(warm, 50) * 1000,
+            'p95_ms': percentile(warm, 95) * 1000,
+            'mean_ms': sum(warm) / len(warm) * 1000,
+            'queries': sum(query_counts[1:]) / len(warm),
+            'rc_calls': sum(rc_calls[1:]) / len(warm),
+            'response_bytes': len(response.get_data()),
+        }
+    return results
+
+
+def report(results, previous=None):
+    """Returns a text table of `results`, with the change in p50 from the
+    `previous` results if they are given."""
+    lines = ['{:<20} {:>10} {:>10} {:>10} {:>9} {:>9} {:>9}{}'.format(
+        'endpoint', 'cold ms', 'p50 ms', 'p95 ms', 'queries', 'rc calls', 'cold rc',
+        '   p50 change' if previous else '')]
+    for name, r in results.items():
+        change = ''
+        if previous and name in previous.get('results', {}):
+            before = previous['results'][name]['p50_ms']
+            change = '   {:+.1f}%'.format((r['p50_ms'] - before) / before * 100 if before else 0)
+        lines.append('{:<20} {:>10.1f} {:>10.1f} {:>10.1f} {:>9.1f} {:>9.1f} {:>9}{}'.format(
+            name, r['cold_ms'], r['p50_ms'], r['p95_ms'], r['queries'], r['rc_calls'],
+            r['cold_rc_calls'], change))
+    return '\n'.join(lines)
+
+
+def metadata(population, iterations):
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'batches': len(population.rc_data.batches),
+        'people': len(population.rc_data.profiles),
+        'rc_latency_ms': rc.latency * 1000,
+        'rc_jitter_ms': rc.jitter * 1000,
+        'rc_error_rate': rc.error_rate,
+        'niceties': len(population.niceties),
+        'iterations': iterations,
+    }
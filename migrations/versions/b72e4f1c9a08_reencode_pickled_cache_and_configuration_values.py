@@ -0,0 +1,63 @@
+"""re-encode pickled cache and configuration values
+
+Revision ID: b72e4f1c9a08
+Revises: 3f6c2a9d41b7
+Create Date: 2026-10-17 14:02:11.518203
+
+"""
+import pickle
+
+from alembic import op
+import sqlalchemy as sa
+
+from backend import codec
+
+
+# revision identifiers, used by Alembic.
+revision = 'b72e4f1c9a08'
+down_revision = '3f6c2a9d41b7'
+branch_labels = None
+depends_on = None
+
+# Rows re-encoded per statement
+CHUNK_SIZE = 500
+
+
+def reencode(table_name, convert, discard_failures):
+    """Rewrite every `value` in `table_name` with `convert`. Rows whose values
+    cannot be converted are deleted if `discard_failures` is set (cached values
+    can always be fetched again), and otherwise abort the migration."""
+    connection = op.get_bind()
+    table = sa.table(table_name, sa.column('key', sa.String), sa.column('value', sa.LargeBinary))
+    keys = [key for key, in connection.execute(sa.select([table.c.key]).order_by(table.c.key))]
+    update = (table.update()
+              .where(table.c.key == sa.bindparam('old_key'))
+              .values(value=sa.bindparam('new_value')))
+    for i in range(0, len(keys), CHUNK_SIZE):
+        rows = connection.execute(
+            sa.select([table.c.key, table.c.value]).where(table.c.key.in_(keys[i:i + CHUNK_SIZE])))
+        updates = []
+        failures = []
+        for key, value in rows:
+            if value is None:
+                continue
+            try:
+                updates.append({'old_key': key, 'new_value': convert(bytes(value))})
+            except Exception:
+                if not discard_failures:
+                    raise
+                failures.append(key)
+        if updates:
+            connection.execute(update, updates)
+        if failures:
+            connection.execute(table.delete().where(table.c.key.in_(failures)))
+
+
+def upgrade():
+    reencode('cache', lambda value: codec.dumps(pickle.loads(value)), discard_failures=True)
+    reencode('site_configuration', lambda value: codec.dumps(pickle.loads(value)), discard_failures=False)
+
+
+def downgrade():
+    reencode('cache', lambda value: pickle.dumps(codec.loads(value)), discard_failures=True)
+    reencode('site_configuration', lambda value: pickle.dumps(codec.loads(value)), discard_failures=False)
@@ -0,0 +1,41 @@
+"""Settings the backend needs before it can be imported, and shared fixtures.
+Tests which need a migrated Postgres use the `database` fixture, and are
+skipped unless DATABASE_URL is set."""
+import os
+
+import pytest
+
+DATABASE_CONFIGURED = bool(os.environ.get('DATABASE_URL'))
+
+os.environ.setdefault('DATABASE_URL', 'postgresql://localhost/unconfigured')
+os.environ.setdefault('FLASK_SECRET_KEY_B64', 'dGVzdA==')
+os.environ.setdefault('DEV', 'TRUE')
+os.environ.setdefault('MOCK_OUT_RC_API', 'TRUE')
+
+
+@pytest.fixture
+def database():
+    if not DATABASE_CONFIGURED:
+        pytest.skip('DATABASE_URL is not set')
+
+
+from backend import app  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """A test client for `app` in testing mode, in which query budgets are
+    enforced. Users are read from the session, so logging in with `log_in`
+    needs no database."""
+    monkeypatch.setattr(app, 'testing', True)
+    monkeypatch.setitem(app.config, 'USER_SESSION_SNAPSHOT', True)
+    return app.test_client()
+
+
+def log_in(client, user_id):
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['rc_token'] = {'access_token': 'a', 'refresh_token': 'r', 'expires_at': 2 ** 40}
+        session['user'] = {'id': user_id, 'name': 'Test', 'avatar_url': None, 'faculty': False,
+                           'anonymous_by_default': False, 'autosave_timeout': 10,
+                           'autosave_enabled': True, 'random_seed': b''}
@@ -0,0 +1,58 @@
+"""Lookups in `util.BatchIndex` around a batch's closing time, 10am on its end
+date."""
+from datetime import date, datetime, timedelta
+
+import pytest
+from backend.util import BatchIndex
+
+BATCHES = [
+    {'id': 1, 'end_date': '2020-02-13'},
+    {'id': 2, 'end_date': '2020-03-26'},
+    {'id': 3, 'end_date': None},
+    {'id': 4, 'end_date': '2020-05-07'},  # not started yet
+    {'id': 5, 'end_date': '2020-03-26'},  # a mini batch ending with batch 2
+    {'id': 6, 'end_date': '2020-01-02'},
+]
+
+CLOSING = datetime(2020, 2, 13, 10)
+
+
+@pytest.fixture
+def index():
+    return BatchIndex(BATCHES)
+
+
+def ids(batches):
+    return [batch['id'] for batch in batches]
+
+
+def test_open_batches_close_at_ten_on_their_end_date(index):
+    assert ids(index.open_batches(CLOSING - timedelta(seconds=1))) == [1, 2, 4, 5]
+    assert ids(index.open_batches(CLOSING)) == [2, 4, 5]
+
+
+def test_open_batches_keep_the_order_given(index):
+    assert ids(index.open_batches(datetime(2019, 1, 1))) == [1, 2, 4, 5, 6]
+
+
+def test_next_window_runs_to_the_next_end_date(index):
+    assert index.next_window(datetime(2020, 2, 12, 12)) == timedelta(hours=12)
+    # Until closing time the window is that of the batch ending today
+    assert index.next_window(CLOSING - timedelta(hours=1)) == timedelta(hours=-9)
+    assert index.next_window(CLOSING) == datetime(2020, 3, 26) - CLOSING
+    assert index.next_window(datetime(2020, 5, 7, 10)) is None
+
+
+def test_staying_and_leaving_ignore_batches_not_yet_started(index):
+    assert index.staying_and_leaving(CLOSING - timedelta(seconds=1)) == (datetime(2020, 3, 26),
+                                                                         datetime(2020, 2, 13))
+    assert index.staying_and_leaving(CLOSING) == (datetime(2020, 5, 7), datetime(2020, 3, 26))
+    assert index.staying_and_leaving(datetime(2020, 4, 1)) == (None, datetime(2020, 5, 7))
+    assert index.staying_and_leaving(datetime(2020, 6, 1)) == (None, None)
+
+
+def test_ending_around_includes_the_batches_ending_next(index):
+    assert sorted(index.ending_around([date(2020, 2, 13)])) == [1, 2, 5]
+    assert sorted(index.ending_around([date(2020, 2, 14)])) == [2, 5]
+    assert sorted(index.ending_around([date(2020, 5, 7), date(2020, 1, 2)])) == [1, 4, 6]
+    assert index.ending_around([date(2021, 1, 1)]) == []
@@ -0,0 +1,80 @@
+"""The SQL statement budgets of the busiest views, enforced in testing mode."""
+import pytest
+from backend import app, db, util
+from backend.models import Nicety, User
+from backend.querystats import QueryBudgetExceeded, query_budget
+from sqlalchemy import event
+from tests.conftest import log_in
+
+pytestmark = pytest.mark.usefixtures('database')
+
+# Target of the niceties these tests save, which no RC user has
+TARGET_ID = 2 ** 31 - 1
+
+
+@pytest.fixture
+def user_id():
+    user = User.query.first()
+    if user is None:
+        pytest.skip('no users in the database')
+    yield user.id
+    Nicety.query.filter_by(target_id=TARGET_ID).delete()
+    db.session.commit()
+
+
+@pytest.fixture
+def statements():
+    """The SQL statements run while the test runs."""
+    run = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        run.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', count)
+    yield run
+    event.remove(db.engine, 'before_cursor_execute', count)
+
+
+def save(client, *niceties):
+    return client.post('/api/v1/save-niceties', json={'niceties': [
+        dict({'target_id': TARGET_ID, 'text': 'Thanks', 'end_date': '2020-01-02'}, **n) for n in niceties]})
+
+
+def test_save_niceties_is_within_budget(client, user_id, statements, monkeypatch):
+    monkeypatch.setitem(app.config, 'SAVE_COALESCE_SECONDS', 0)
+    log_in(client, user_id)
+    response = save(client, {}, {'end_date': None}, {'end_date': '2020-02-03'})
+    assert response.status_code == 200
+    assert 0 < len(statements) <= 4
+
+
+def test_niceties_from_me_is_within_budget(client, user_id, statements, monkeypatch):
+    monkeypatch.setitem(app.config, 'SAVE_COALESCE_SECONDS', 0)
+    log_in(client, user_id)
+    save(client, {}, {'end_date': '2020-02-03'})
+    del statements[:]
+    response = client.get('/api/v1/niceties-from-me?limit=1')
+    assert response.status_code == 200
+    # One statement for the ETag's version of the niceties, one for the page
+    assert len(statements) == 2
+
+
+def test_going_over_budget_fails(client):
+    @query_budget(1)
+    def view():
+        db.session.query(Nicety.id).first()
+        db.session.query(Nicety.id).first()
+
+    with app.test_request_context(), pytest.raises(QueryBudgetExceeded):
+        view()
+
+
+def test_statements_on_worker_threads_count(client):
+    def lookup():
+        return db.session.query(Nicety.id).first()
+
+    @query_budget(1)
+    def view():
+        util.call_concurrently(lookup, lookup)
+
+    with app.test_request_context(), pytest.raises(QueryBudgetExceeded):
+        view()
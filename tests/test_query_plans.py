@@ -0,0 +1,52 @@
+"""Checks, with EXPLAIN, that Postgres can answer the busiest nicety queries
+from the indexes added for them."""
+from datetime import datetime, timedelta
+
+import pytest
+from backend import api, app, db
+from backend.models import Nicety, User
+from flask import g
+from sqlalchemy.dialects import postgresql
+
+pytestmark = pytest.mark.usefixtures('database')
+
+
+def explain(query):
+    """The plan of `query`, with sequential scans discouraged so that a small
+    test table does not hide whether an index could be used."""
+    statement = query.statement.compile(dialect=postgresql.dialect())
+    connection = db.session.connection()
+    try:
+        connection.execute('SET LOCAL enable_seqscan = off')
+        rows = connection.execute('EXPLAIN ' + str(statement), statement.params)
+        return '\n'.join(row[0] for row in rows)
+    finally:
+        db.session.rollback()
+
+
+@pytest.fixture
+def as_user():
+    with app.test_request_context():
+        g.current_user = User(1, 'Test')
+        yield
+
+
+def test_niceties_for_me_uses_target_index(as_user):
+    assert 'ix_nicety_target_id_end_date' in explain(api.niceties_for_me_query())
+
+
+def test_admin_window_uses_end_date_index(as_user):
+    assert 'ix_nicety_end_date_target_id' in explain(api.admin_niceties_query())
+
+
+def test_print_targets_use_end_date_index(as_user):
+    in_window = (Nicety.end_date > datetime.now() - timedelta(days=21),
+                 Nicety.end_date < datetime.now() + timedelta(days=21))
+    query = db.session.query(Nicety.target_id).filter(*in_window).distinct()
+    assert 'ix_nicety_end_date_target_id' in explain(query)
+
+
+def test_niceties_for_me_pages_are_read_in_index_order(as_user):
+    plan = explain(api.page_query(api.niceties_for_me_query(), 21, datetime(2020, 1, 1).date(), 1))
+    assert 'ix_nicety_target_id_end_date' in plan
+    assert 'Sort' not in plan
@@ -0,0 +1,54 @@
+"""Saving niceties through the write-behind buffer. None of these need a
+database."""
+import pytest
+from backend import scheduler, writebehind
+from backend.writebehind import WriteBehindBuffer
+from tests.conftest import log_in
+
+
+def row(target_id, text):
+    return {'author_id': 1, 'target_id': target_id, 'end_date': None, 'text': text}
+
+
+@pytest.fixture
+def no_flusher(monkeypatch):
+    monkeypatch.setattr(scheduler, 'every', lambda *args: None)
+    monkeypatch.setattr(writebehind.atexit, 'register', lambda f: None)
+
+
+def writer(written):
+    def write(rows):
+        if any(r['text'] == 'bad' for r in rows):
+            raise ValueError('cannot store this row')
+        written.extend(rows)
+    return write
+
+
+def test_bad_row_does_not_hold_up_the_rest(no_flusher):
+    written = []
+    buffer = WriteBehindBuffer(60, writer(written))
+    buffer.add([row(2, 'bad'), row(3, 'good')])
+    assert buffer.flush() == 1
+    assert written == [row(3, 'good')]
+    assert buffer.pending(1) == []
+
+
+def test_rows_are_kept_when_none_can_be_written(no_flusher):
+    buffer = WriteBehindBuffer(60, writer([]))
+    buffer.add([row(2, 'bad')])
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+    assert buffer.pending(1) == [row(2, 'bad')]
+
+
+@pytest.mark.parametrize('nicety', [
+    {'target_id': 2, 'text': 'hi', 'anonymous': 'maybe'},
+    {'target_id': 'two', 'text': 'hi'},
+    {'target_id': 2, 'text': 'hi', 'end_date': '17/10/2026'},
+    {'target_id': 2, 'text': None},
+    {'target_id': 2, 'text': 'hi', 'no_read': 1},
+])
+def test_invalid_niceties_are_rejected(client, nicety):
+    log_in(client, 1)
+    response = client.post('/api/v1/save-niceties', json={'niceties': [nicety]})
+    assert response.status_code == 400